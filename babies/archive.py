@@ -0,0 +1,72 @@
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Iterator, List, Optional
+
+from .config import DEFAULT_ARCHIVE_AFTER_DAYS, get_user_config
+from .segments import (
+    COMPRESSION_EXTENSIONS,
+    DEFAULT_COMPRESSION,
+    map_in_order,
+    read_compressed_file,
+    write_compressed_file,
+)
+from .yaml import dump_yaml_bytes, load_yaml_chunk
+
+
+def get_archive_path(dirpath: str) -> str:
+    return os.path.join(dirpath, ".videos.archive")
+
+
+def get_archive_after_days() -> Optional[int]:
+    config = get_user_config()
+    return config.get_archive_after_days() if config else DEFAULT_ARCHIVE_AFTER_DAYS
+
+
+def get_archive_segments(dirpath: str) -> List[str]:
+    """
+    Paths of the archive segments of a series, oldest first
+    """
+    archive_path = get_archive_path(dirpath)
+    try:
+        filenames = os.listdir(archive_path)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(archive_path, filename)
+        for filename in sorted(filenames)
+        if not filename.endswith(".tmp")
+    ]
+
+
+def write_archive_segment(
+    dirpath: str, entries: List[Any], compression: str = DEFAULT_COMPRESSION
+) -> str:
+    """
+    Write entries to a new compressed archive segment, returns its path
+    """
+    archive_path = get_archive_path(dirpath)
+    os.makedirs(archive_path, exist_ok=True)
+    # named so that sorting the segments orders them by when they were written
+    name = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    extension = ".yaml" + COMPRESSION_EXTENSIONS[compression]
+    segment_path = os.path.join(archive_path, name + extension)
+    suffix = 1
+    while os.path.exists(segment_path):
+        segment_path = os.path.join(archive_path, f"{name}.{suffix}{extension}")
+        suffix += 1
+
+    write_compressed_file(segment_path, dump_yaml_bytes(entries))
+    return segment_path
+
+
+def iter_archived_entries(dirpath: str) -> Iterator[Any]:
+    """
+    Yield every archived entry of a series in the order they were archived
+    """
+    for data in map_in_order(read_compressed_file, get_archive_segments(dirpath)):
+        yield from load_yaml_chunk(data)
+
+
+def remove_archive(dirpath: str) -> None:
+    shutil.rmtree(get_archive_path(dirpath), ignore_errors=True)
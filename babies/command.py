@@ -1,25 +1,66 @@
 import sys
 import argparse
 import os
+import re
+from datetime import datetime, timedelta
 
-from .media import (
-    play_media,
-    record_media,
-    print_path_to_media,
-    enqueue_media,
-    dequeue_media,
-    grep_media_record,
-    create_record_from_directory,
-)
-from .db import Db
-from .youtube import search_youtube
-from .spotify import search_spotify
-from .config import Config
-from .input import ReadInput
+from .startup import ImportProfiler
+from .web import CACHE_NORMAL, CACHE_OFFLINE, CACHE_REFRESH
+
+TIME_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+def _parse_time_arg(value: str) -> datetime:
+    # relative times like 12h or 7d go back from now
+    relative = re.fullmatch(r"(\d+)([mhdw])", value)
+    if relative:
+        amount, unit = relative.groups()
+        return datetime.now() - timedelta(**{TIME_UNITS[unit]: int(amount)})
+
+    for date_format in ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(value.replace("-", "/"), date_format)
+        except ValueError:
+            pass
+    raise ValueError(f"invalid time: {value}")
+
+
+def _parse_positive_int(value: str) -> int:
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+    if count <= 0:
+        raise argparse.ArgumentTypeError(f"not a positive number: {value}")
+    return count
+
+
+def _add_cache_arguments(search_parser: argparse.ArgumentParser) -> None:
+    cache_group = search_parser.add_mutually_exclusive_group()
+    cache_group.add_argument(
+        "--no-cache",
+        action="store_const",
+        const=CACHE_REFRESH,
+        dest="cache_mode",
+        help="search again rather than using cached results",
+    )
+    cache_group.add_argument(
+        "--offline",
+        action="store_const",
+        const=CACHE_OFFLINE,
+        dest="cache_mode",
+        help="only show cached results, however old",
+    )
+    search_parser.set_defaults(cache_mode=CACHE_NORMAL)
 
 
 def run_babies():
     parser = argparse.ArgumentParser(description="enjoy your media")
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="show how long each module took to import",
+    )
 
     paths_help = (
         "paths to videos/audio and/or directories containing media queue and or/videos"
@@ -36,16 +77,61 @@ def run_babies():
         action="store_true",
         help="force overwrite of existing database",
     )
+    create.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="create a series db in every directory below the paths with shows",
+    )
+    create.add_argument(
+        "-p", "--probe", action="store_true", help="record the duration of each show"
+    )
+    create.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of directories to scan and shows to probe at once",
+    )
 
     find = subparsers.add_parser(
         "find", help="find entry in global record", aliases=["f"]
     )
     find.add_argument(
-        "search_terms", help="regular expressions, all must match", nargs="+"
+        "search_terms", help="regular expressions, all must match", nargs="*"
     )
     find.add_argument(
         "-q", "--quiet", action="store_true", help="only show video names"
     )
+    find.add_argument(
+        "-s",
+        "--since",
+        type=_parse_time_arg,
+        help="only show media started at or after this time, e.g. 2020/12/25 or 7d",
+    )
+    find.add_argument(
+        "-u",
+        "--until",
+        type=_parse_time_arg,
+        help="only show media started before this time, e.g. 2020/12/25 or 12h",
+    )
+    find.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of processes to search with, defaults to the number of cores",
+    )
+
+    log = subparsers.add_parser(
+        "log", help="show most recent entries in global record", aliases=["lg"]
+    )
+    log.add_argument(
+        "-l",
+        "--last",
+        type=_parse_positive_int,
+        default=10,
+        help="number of entries to show",
+    )
+    log.add_argument("-q", "--quiet", action="store_true", help="only show video names")
 
     watch = subparsers.add_parser(
         "watch",
@@ -65,10 +151,77 @@ def run_babies():
     watch.add_argument("-s", "--sub-file", help="subtitle file")
     watch.add_argument("-c", "--comment", help="comment to record with video(s)")
     watch.add_argument("-t", "--title", help="title to record with video(s)")
+    watch.add_argument(
+        "-b",
+        "--binge",
+        action="store_true",
+        help="keep watching each series in one player until it is complete",
+    )
+
+    compact = subparsers.add_parser(
+        "compact", help="seal and compress old entries in global record"
+    )
+    compact.add_argument(
+        "-c",
+        "--compression",
+        default="gzip",
+        choices=["gzip", "lzma", "zstd"],
+        help="compression used for sealed segments",
+    )
+
+    migrate = subparsers.add_parser(
+        "migrate", help="convert series db to another storage format"
+    )
+    migrate.add_argument("paths", help="directories containing series dbs", nargs="*")
+    migrate.add_argument(
+        "-t",
+        "--to",
+        required=True,
+        choices=["yaml", "jsonl", "sqlite"],
+        help="storage format to convert to",
+    )
+
+    archive = subparsers.add_parser(
+        "archive", help="archive, show or restore watched queue entries"
+    )
+    archive.add_argument("paths", help="directories containing queues", nargs="*")
+    archive.add_argument(
+        "-d",
+        "--days",
+        type=int,
+        help="archive entries finished more than this many days ago",
+    )
+    archive.add_argument(
+        "-r", "--restore", action="store_true", help="restore archived entries"
+    )
+    archive.add_argument(
+        "-l", "--list", action="store_true", help="show archived entries"
+    )
+    archive.add_argument(
+        "-s",
+        "--search",
+        action="append",
+        default=[],
+        help="with --list only show entries matching this regular expression",
+    )
+    archive.add_argument(
+        "-q", "--quiet", action="store_true", help="only show video names"
+    )
 
     enqueue = subparsers.add_parser("enqueue", help="enqueue shows", aliases=["e"])
     enqueue.add_argument("queue_path", help="directory to story queue in")
-    enqueue.add_argument("paths", help=paths_help, nargs="+")
+    enqueue.add_argument("paths", help=paths_help, nargs="*")
+    enqueue.add_argument(
+        "-f",
+        "--from-file",
+        help="file with a path to enqueue on each line, - to read from stdin",
+    )
+    enqueue.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of series to read at once, defaults to the number of cores",
+    )
     enqueue.add_argument("-c", "--comment", help="comment to record with video(s)")
     enqueue.add_argument("-t", "--title", help="title to record with video(s)")
     enqueue.add_argument(
@@ -102,6 +255,29 @@ def run_babies():
         help="do not filter out non-videos",
     )
 
+    next_cmd = subparsers.add_parser(
+        "next", help="display next show of every series in a library"
+    )
+    next_cmd.add_argument(
+        "-l",
+        "--library",
+        action="append",
+        required=True,
+        help="directory to search for series in, can be repeated",
+    )
+    next_cmd.add_argument("-v", "--verbose", action="store_true", help="verbose output")
+    next_cmd.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of series to load at once, defaults to the number of cores",
+    )
+    next_cmd.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="load every series rather than using the cached next shows",
+    )
+
     path_help = "paths to video and/or directory containing series and or/video"
     record = subparsers.add_parser(
         "record", help="record having watched video", aliases=["r"]
@@ -121,13 +297,46 @@ def run_babies():
     search_youtube_cmd.add_argument(
         "-r", "--raw", help="show raw search results", action="store_true"
     )
+    search_youtube_cmd.add_argument(
+        "-l",
+        "--limit",
+        type=int,
+        default=50,
+        help="number of search results to show, fetched a page of 50 at a time",
+    )
+    search_youtube_cmd.add_argument(
+        "-x",
+        "--exact-durations",
+        action="store_true",
+        help="look up the duration of each video, one request per page",
+    )
+    search_youtube_cmd.add_argument(
+        "-f",
+        "--format",
+        choices=["yaml", "ndjson"],
+        default="yaml",
+        help="show results as a yaml list or as a json object on each line",
+    )
+    _add_cache_arguments(search_youtube_cmd)
 
     search_spotify_cmd = subparsers.add_parser(
         "search_spotify", help="search spotify", aliases=["ss"]
     )
     search_spotify_cmd.add_argument(
-        "search_terms", help="spotify search terms", nargs="+"
+        "search_terms", help="spotify search terms", nargs="*"
+    )
+    search_spotify_cmd.add_argument(
+        "-b",
+        "--batch",
+        help="file with a query to search for on each line, - to read from stdin",
     )
+    search_spotify_cmd.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of queries in a batch to search for at once",
+    )
+    _add_cache_arguments(search_spotify_cmd)
     search_spotify_cmd.add_argument(
         "-l", "--limit", help="number of search results to return", type=int
     )
@@ -135,6 +344,41 @@ def run_babies():
         "-r", "--raw", help="show raw search results", action="store_true"
     )
 
+    search_cmd = subparsers.add_parser(
+        "search",
+        help="search youtube, spotify and the global record at once",
+        aliases=["s"],
+    )
+    search_cmd.add_argument("search_terms", help="search terms", nargs="+")
+    search_cmd.add_argument(
+        "-s",
+        "--source",
+        action="append",
+        choices=["youtube", "spotify", "record"],
+        help="only search this source, can be repeated",
+    )
+    search_cmd.add_argument(
+        "-l",
+        "--limit",
+        type=int,
+        default=20,
+        help="number of results to show from each source",
+    )
+    search_cmd.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        help="seconds to wait for each source rather than its default",
+    )
+    search_cmd.add_argument(
+        "-f",
+        "--format",
+        choices=["yaml", "ndjson"],
+        default="yaml",
+        help="show results as a yaml list or as a json object on each line",
+    )
+    _add_cache_arguments(search_cmd)
+
     listen_command = subparsers.add_parser(
         "listen", help="listen to song", aliases=["l"]
     )
@@ -147,6 +391,47 @@ def run_babies():
 
     args = parser.parse_args(argv)
 
+    profiler = None
+    if args.startup_profile:
+        profiler = ImportProfiler()
+        profiler.start()
+    try:
+        _run_subcommand(parser, args)
+    finally:
+        if profiler:
+            profiler.stop()
+            print(profiler.report(), file=sys.stderr)
+
+
+def _run_subcommand(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    # only imported once the arguments are parsed so the backends a
+    # subcommand does not use are never loaded, the players and searches
+    # also import their backends when first used
+    from .media import (
+        play_media,
+        binge_media,
+        record_media,
+        print_path_to_media,
+        print_next_in_library,
+        enqueue_media,
+        dequeue_media,
+        grep_media_record,
+        print_media_record_log,
+        compact_media_record,
+        migrate_media,
+        archive_media,
+        restore_archived_media,
+        print_archived_media,
+        create_records_from_directories,
+        expand_spotify_paths,
+    )
+    from .youtube import search_youtube
+    from .spotify import search_spotify, search_spotify_batch
+    from .files import read_lines
+    from .federated import SOURCES, search_everywhere
+    from .config import Config
+    from .input import ReadInput
+
     paths = []
     try:
         if args.paths:
@@ -162,23 +447,62 @@ def run_babies():
     if subcommand is None:
         play_media(read_input, os.getcwd())
     elif subcommand == "listen" or subcommand == "l":
-        for track in args.tracks:
+        # albums and playlists are played a track at a time
+        for track in expand_spotify_paths(args.tracks):
             play_media(read_input, track)
     elif subcommand == "create" or subcommand == "c":
-        for path in paths:
-            db = Db()
-            create_record_from_directory(db, path, args.force)
+        create_records_from_directories(
+            paths,
+            force=args.force,
+            recursive=args.recursive,
+            probe=args.probe,
+            jobs=args.jobs,
+        )
     elif subcommand == "find" or subcommand == "f":
-        grep_media_record(args.search_terms, args.quiet)
+        if not args.search_terms and not args.since and not args.until:
+            parser.error("find requires search terms and/or --since/--until")
+        grep_media_record(
+            args.search_terms,
+            args.quiet,
+            since=args.since,
+            until=args.until,
+            jobs=args.jobs,
+        )
+    elif subcommand == "log" or subcommand == "lg":
+        print_media_record_log(args.last, args.quiet)
+    elif subcommand == "compact":
+        compact_media_record(args.compression)
+    elif subcommand == "migrate":
+        migrate_media(paths, args.to)
+    elif subcommand == "next":
+        print_next_in_library(
+            args.library,
+            verbose=args.verbose,
+            jobs=args.jobs,
+            use_cache=not args.no_cache,
+        )
+    elif subcommand == "archive":
+        if args.restore:
+            restore_archived_media(paths)
+        elif args.list:
+            print_archived_media(paths, args.search, args.quiet)
+        else:
+            archive_media(paths, args.days)
     elif subcommand == "record" or subcommand == "r":
         record_media(args.path, args.comment)
     elif subcommand == "enqueue" or subcommand == "e":
+        enqueue_paths = args.paths
+        if args.from_file:
+            enqueue_paths = enqueue_paths + read_lines(args.from_file)
+        if not enqueue_paths:
+            parser.error("enqueue requires paths and/or --from-file")
         enqueue_media(
             args.queue_path,
-            paths,
+            enqueue_paths,
             comment=args.comment,
             prune=args.prune,
             title=args.title,
+            jobs=args.jobs,
         )
     elif subcommand == "dequeue" or subcommand == "de":
         dequeue_media(args.queue_path, paths)
@@ -189,25 +513,76 @@ def run_babies():
             verbose=args.verbose,
             no_extension_filter=args.no_extension_filter,
         )
+    elif subcommand == "search" or subcommand == "s":
+        search_everywhere(
+            Config(),
+            args.search_terms,
+            sources=args.source or SOURCES,
+            limit=args.limit,
+            timeout=args.timeout,
+            cache_mode=args.cache_mode,
+            output_format=args.format,
+        )
     elif subcommand == "search_youtube" or subcommand == "syt":
         config = Config()
-        search_youtube(config, args.search_terms, duration=args.duration, raw=args.raw)
+        search_youtube(
+            config,
+            args.search_terms,
+            duration=args.duration,
+            raw=args.raw,
+            cache_mode=args.cache_mode,
+            limit=args.limit,
+            exact_durations=args.exact_durations,
+            output_format=args.format,
+        )
     elif subcommand == "search_spotify" or subcommand == "ss":
         config = Config()
-        search_spotify(config, args.search_terms, limit=args.limit, raw=args.raw)
+        if args.batch:
+            queries = read_lines(args.batch)
+            if args.search_terms:
+                queries.insert(0, " ".join(args.search_terms))
+            search_spotify_batch(
+                config,
+                queries,
+                limit=args.limit,
+                raw=args.raw,
+                jobs=args.jobs,
+                cache_mode=args.cache_mode,
+            )
+        elif args.search_terms:
+            search_spotify(
+                config,
+                args.search_terms,
+                limit=args.limit,
+                raw=args.raw,
+                cache_mode=args.cache_mode,
+            )
+        else:
+            parser.error("search_spotify requires search terms and/or --batch")
     else:
         night_mode = subcommand == "night" or subcommand == "n"
         dry_run = subcommand == "dryrun" or subcommand == "d"
         if night_mode or dry_run or subcommand == "watch" or subcommand == "w":
-            for path in paths:
-                play_media(
+            if args.binge:
+                binge_media(
                     read_input,
-                    path,
+                    paths,
                     dont_record=dry_run or args.dont_record,
                     night_mode=night_mode or args.night_mode,
                     sub_file=args.sub_file,
                     comment=args.comment,
                     title=args.title,
                 )
+            else:
+                for path in paths:
+                    play_media(
+                        read_input,
+                        path,
+                        dont_record=dry_run or args.dont_record,
+                        night_mode=night_mode or args.night_mode,
+                        sub_file=args.sub_file,
+                        comment=args.comment,
+                        title=args.title,
+                    )
 
     read_input.destroy()
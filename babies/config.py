@@ -1,11 +1,26 @@
 from os import path
+from functools import lru_cache
 from xdg import BaseDirectory
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 from datetime import datetime
 
-from .yaml import load_yaml_file, save_yaml_file
+from .files import write_atomically
+from .yaml import load_yaml_file, dump_yaml_bytes
 
 DEFAULT_SPOTIFY_MARKET = "US"
+DEFAULT_STORAGE = "yaml"
+DEFAULT_ARCHIVE_AFTER_DAYS = 30
+# megabytes read ahead from the next video, and the cap in megabytes a second
+DEFAULT_PREFETCH_SIZE = 64
+DEFAULT_PREFETCH_BANDWIDTH = 20
+# seconds a search response is used for before it is revalidated
+DEFAULT_CACHE_TTLS: Dict[str, float] = {
+    "youtube": 24 * 60 * 60,
+    "spotify": 60 * 60,
+    "spotify-collections": 60 * 60,
+}
+# megabytes of search responses kept
+DEFAULT_CACHE_SIZE = 50
 
 
 def _load_first_data(path: str) -> Optional[str]:
@@ -31,26 +46,64 @@ class Config:
             raise ValueError("No youtube-api-key configuration element found")
         return api_key
 
-    def get_spotify_access_token(self) -> Optional[str]:
+    def get_storage(self) -> str:
+        return self.config.get("storage", DEFAULT_STORAGE)
+
+    def get_archive_after_days(self) -> Optional[int]:
+        # false disables archiving
+        days = self.config.get("archive-after-days", DEFAULT_ARCHIVE_AFTER_DAYS)
+        if days is False or days is None:
+            return None
+        return int(days)
+
+    def get_prefetch_options(self) -> Tuple[float, float]:
+        """
+        Size in megabytes to prefetch from the next video, 0 disables it, and
+        the bandwidth cap in megabytes a second, 0 for no cap
+        """
+        return (
+            float(self.config.get("prefetch-size", DEFAULT_PREFETCH_SIZE)),
+            float(self.config.get("prefetch-bandwidth", DEFAULT_PREFETCH_BANDWIDTH)),
+        )
+
+    def get_cache_options(self) -> Tuple[Dict[str, float], float]:
+        """
+        Seconds the responses from each source are used for, 0 to always
+        revalidate them, and the size in megabytes of the response cache
+        """
+        ttls = dict(DEFAULT_CACHE_TTLS)
+        ttls.update(self.config.get("cache-ttl", None) or {})
+        return (
+            {source: float(ttl) for source, ttl in ttls.items()},
+            float(self.config.get("cache-size", DEFAULT_CACHE_SIZE)),
+        )
+
+    def get_spotify_access_token(self) -> Optional[Tuple[str, datetime]]:
+        """
+        The stored spotify access token and when it expires
+        """
         data_path = _load_first_data("babies.yaml")
         if not data_path:
             return None
 
-        data = load_yaml_file(data_path)
+        data = load_yaml_file(data_path) or {}
         spotify = data.get("spotify", None)
         if not spotify:
             return None
 
-        if datetime.now() >= spotify["expires"]:
-            return None
-
-        return spotify["access_token"]
+        return spotify["access_token"], spotify["expires"]
 
-    def save_spotify_access_token(self, token, expires) -> None:
-        data_path = path.join(BaseDirectory.xdg_data_home, "babies.yaml")
-        save_yaml_file(
-            data_path, {"spotify": {"access_token": token, "expires": expires}}
-        )
+    def save_spotify_access_token(self, token: str, expires: datetime) -> None:
+        data_path = path.join(BaseDirectory.save_data_path(""), "babies.yaml")
+        data: Dict[str, Any] = {}
+        if path.isfile(data_path):
+            data = load_yaml_file(data_path) or {}
+        # only the token is replaced so anything else stored is kept
+        data["spotify"] = {"access_token": token, "expires": expires}
+        # replaced in one step so a concurrent read never sees half a file
+        encoded = dump_yaml_bytes(data)
+        with write_atomically(data_path, "wb") as stream:
+            stream.write(encoded)
 
     def get_spotify_client_id_and_secret(self) -> Tuple[str, str]:
         spotify_config = self.config.get("spotify", None)
@@ -70,3 +123,17 @@ class Config:
             return DEFAULT_SPOTIFY_MARKET
         else:
             return spotify_config.get("market", DEFAULT_SPOTIFY_MARKET)
+
+
+@lru_cache(maxsize=None)
+def get_user_config() -> Optional[Config]:
+    """
+    The configuration file loaded once for the whole process, or None when
+    there is no configuration file so the defaults are used
+    """
+    config = Config()
+    try:
+        config.load()
+    except ValueError:
+        return None
+    return config
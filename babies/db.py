@@ -1,8 +1,45 @@
 import os
-from typing import List, Dict, Optional
+import hashlib
+import itertools
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, List, Dict, Iterator, Optional, Pattern, Tuple
 from mypy_extensions import TypedDict
 
-from .yaml import load_yaml_file, save_yaml_file
+from .yaml import save_yaml_file, iter_yaml_list_file
+from .index import RecordIndex, get_literal_term
+from .storage import (
+    SERIES_DB_BASENAME,
+    find_series_db,
+    get_series_db,
+    get_storage,
+)
+from .search import RecordSearch, search_record
+from .offsets import OffsetIndex
+from .journal import (
+    JournalOp,
+    JOURNAL_COMPACT_THRESHOLD,
+    get_journal_path,
+    read_journal,
+    append_journal,
+    remove_journal,
+)
+from .archive import (
+    get_archive_after_days,
+    write_archive_segment,
+    iter_archived_entries,
+    remove_archive,
+)
+from .formatting import parse_date, parse_duration, format_date, format_duration
+from .segments import (
+    iter_sealed_records,
+    get_segments_between,
+    load_manifest,
+    compact_global_record,
+    finish_compaction,
+    lock_global_record,
+    DEFAULT_COMPRESSION,
+)
 
 # set this when the end is unknown... assume it finished sometime
 UNKNOWN_END = "sometime at finished?"
@@ -20,93 +57,849 @@ class MediaEntry(TypedDict, total=False):
     end: str
 
 
-MediaDb = List[MediaEntry]
+class SessionTime:
+    """
+    A point in a viewing session formatted as "<date> at <position>", the raw
+    string is kept so that it round-trips exactly and is only parsed on access
+    """
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: str):
+        self.raw = raw
+
+    @staticmethod
+    def at(time: Optional[datetime], position: float) -> "SessionTime":
+        date = format_date(time) if time else "unknown"
+        return SessionTime(date + " at " + format_duration(position))
+
+    def __split(self) -> Tuple[str, str]:
+        date, _, position = self.raw.partition(" at ")
+        return date, position
+
+    @property
+    def time(self) -> Optional[datetime]:
+        return parse_date(self.__split()[0])
+
+    @property
+    def position(self) -> Optional[float]:
+        """
+        Position in seconds or None when it is unknown
+        """
+        return parse_duration(self.__split()[1])
+
+    @property
+    def is_assumed_finished(self) -> bool:
+        return self.__split()[1] == "finished?"
+
+
+class Viewing:
+    __slots__ = ("start", "end", "comment", "extra")
+
+    def __init__(
+        self,
+        start: SessionTime,
+        end: SessionTime,
+        comment: Optional[str] = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ):
+        self.start = start
+        self.end = end
+        self.comment = comment
+        # unknown fields are kept so the viewing round-trips
+        self.extra = extra
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Viewing":
+        extra = {k: v for k, v in data.items() if k not in _VIEWING_FIELDS}
+        return Viewing(
+            SessionTime(data.get("start", "")),
+            SessionTime(data.get("end", "")),
+            data.get("comment", None),
+            extra or None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"start": self.start.raw, "end": self.end.raw}
+        if self.comment is not None:
+            data["comment"] = self.comment
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+_VIEWING_FIELDS = ("start", "end", "comment")
+
+
+class Entry:
+    """
+    A show in a series db, viewings are only decoded when they are accessed
+    """
+
+    __slots__ = (
+        "media_type",
+        "media",
+        "alias",
+        "comment",
+        "title",
+        "__duration",
+        "__viewings",
+        "__raw_viewings",
+        "__keys",
+        "extra",
+    )
+
+    def __init__(self, media: str, media_type="video", alias: Optional[str] = None):
+        self.media_type = media_type
+        self.media = media
+        self.alias = alias
+        self.comment: Optional[str] = None
+        self.title: Optional[str] = None
+        self.__duration: Optional[str] = None
+        self.__viewings: Optional[List[Viewing]] = None
+        self.__raw_viewings: Optional[List[Dict[str, Any]]] = None
+        # order of the keys when loaded so that the entry round-trips
+        self.__keys: Tuple[str, ...] = ()
+        self.extra: Optional[Dict[str, Any]] = None
+
+    @property
+    def is_audio(self) -> bool:
+        return self.media_type == "audio"
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        Duration in seconds or None when it is not known
+        """
+        return parse_duration(self.__duration) if self.__duration else None
+
+    @duration.setter
+    def duration(self, duration: Optional[float]) -> None:
+        self.__duration = None if duration is None else format_duration(duration)
+
+    @property
+    def formatted_duration(self) -> Optional[str]:
+        return self.__duration
+
+    @formatted_duration.setter
+    def formatted_duration(self, duration: Optional[str]) -> None:
+        self.__duration = duration
+
+    @property
+    def viewings(self) -> List[Viewing]:
+        if self.__viewings is None:
+            self.__viewings = list(map(Viewing.from_dict, self.__raw_viewings or []))
+            self.__raw_viewings = None
+        return self.__viewings
+
+    @property
+    def viewing_count(self) -> int:
+        if self.__viewings is None:
+            return len(self.__raw_viewings or [])
+        return len(self.__viewings)
+
+    @property
+    def final_viewing_end(self) -> Optional[SessionTime]:
+        # avoids decoding every viewing when only the final one is needed
+        if self.__viewings is None:
+            if not self.__raw_viewings:
+                return None
+            return SessionTime(self.__raw_viewings[-1].get("end", ""))
+        return self.__viewings[-1].end if self.__viewings else None
+
+    def add_viewing(self, viewing: Viewing) -> None:
+        self.viewings.append(viewing)
+
+    def is_finished(self) -> bool:
+        final_end = self.final_viewing_end
+        if not final_end:
+            return False
+
+        # if the final viewing didn't complete the show then it is not finished
+        if final_end.is_assumed_finished:
+            return True
+        position = final_end.position
+        return position is not None and position == self.duration
+
+    @staticmethod
+    def from_dict(data: MediaEntry) -> "Entry":
+        media_type = "video" if "video" in data else "audio"
+        media: str = data.get("video", None) or data.get("audio", "")
+        entry = Entry(media, media_type, data.get("alias", None))
+        entry.comment = data.get("comment", None)
+        entry.title = data.get("title", None)
+        entry.__duration = data.get("duration", None)
+        entry.__raw_viewings = data.get("viewings", None)
+        entry.__keys = tuple(data.keys())
+        extra = {k: v for k, v in data.items() if k not in _ENTRY_FIELDS}
+        entry.extra = extra or None
+        return entry
+
+    def to_dict(self) -> MediaEntry:
+        fields: Dict[str, Any] = {
+            self.media_type: self.media,
+            "alias": self.alias,
+            "comment": self.comment,
+            "title": self.title,
+            "duration": self.__duration,
+        }
+        if self.__viewings is not None:
+            fields["viewings"] = [viewing.to_dict() for viewing in self.__viewings]
+        else:
+            fields["viewings"] = self.__raw_viewings
+        if self.extra:
+            fields.update(self.extra)
+
+        data: Dict[str, Any] = {}
+        # keep the original key order then add new keys in the canonical order
+        for key in self.__keys + _ENTRY_FIELDS + tuple(fields.keys()):
+            value = fields.get(key, None)
+            if value is not None and key not in data:
+                data[key] = value
+        return data  # type: ignore
+
+
+_ENTRY_FIELDS = ("video", "audio", "alias", "comment", "title", "duration", "viewings")
+
+MediaDb = List[Entry]
+
+
+def _get_media_fingerprint(show: Entry) -> str:
+    media = (show.alias or "") + "\0" + show.media
+    return hashlib.sha1(media.encode()).hexdigest()[:20]
+
+
+def _get_entry_fingerprint(show: Entry) -> str:
+    # prefixed with the media fingerprint to detect when only the viewings or
+    # duration of the show have changed
+    final_end = show.final_viewing_end
+    state = "\0".join(
+        (
+            str(show.viewing_count),
+            final_end.raw if final_end else "",
+            show.formatted_duration or "",
+        )
+    )
+    return _get_media_fingerprint(show) + hashlib.sha1(state.encode()).hexdigest()[:20]
+
+
+# extra entry field holding when an archived entry was restored
+RESTORED_FIELD = "restored"
+
+
+def _is_archivable(entry: Entry, finished_before: datetime) -> bool:
+    if not (
+        entry.alias
+        or entry.is_audio
+        or os.path.isabs(entry.media)
+        or "://" in entry.media
+    ):
+        return False
+    final_end = entry.final_viewing_end
+    if not final_end or not entry.is_finished():
+        return False
+    # an entry recorded without a time can not be known to be old
+    end_time = final_end.time
+    if end_time is None or end_time >= finished_before:
+        return False
+    # a restored entry is only as old as its restore, otherwise the next
+    # snapshot would archive it again
+    restored = (entry.extra or {}).get(RESTORED_FIELD)
+    restored_time = parse_date(restored) if isinstance(restored, str) else None
+    return restored_time is None or restored_time < finished_before
 
 
 class Db:
-    def __init__(self):
+    def __init__(self, registry: Optional["DbRegistry"] = None):
+        self.__registry = registry
         self.__video_db: MediaDb = []
         self.aliased_db: Optional[Db] = None
+        # index of the next show in the series and the fingerprint of the show
+        # at that index when it was found, or of the series length when complete
+        self.__cursor: Optional[Tuple[int, str]] = None
+        # changes not yet written to the journal, the number of changes already
+        # in the journal and the directory the series was loaded from
+        self.__pending_ops: List[JournalOp] = []
+        self.__journal_length = 0
+        self.__loaded_from: Optional[str] = None
+        # set when the series changed in a way that is not journalled
+        self.__needs_snapshot = False
 
     def load_series(self, dirpath: str) -> bool:
-        db_path = Db.get_series_db_path(dirpath)
+        db_path, storage = get_series_db(dirpath)
+        self.__pending_ops = []
+        self.__journal_length = 0
+        self.__needs_snapshot = False
         try:
-            self.__video_db = load_yaml_file(db_path)
-            return True
+            self.__video_db = list(map(Entry.from_dict, storage.load(db_path)))
         except FileNotFoundError:
             self.__video_db = []
+            self.__cursor = None
+            self.__loaded_from = None
             return False
 
+        ops = read_journal(get_journal_path(dirpath))
+        for op in ops:
+            self.__apply_op(op)
+        self.__journal_length = len(ops)
+        self.__loaded_from = os.path.abspath(dirpath)
+
+        self.__cursor = Db.__load_cursor(dirpath)
+        return True
+
+    def reload_series(self, dirpath: str) -> bool:
+        """
+        Load the series again after it changed on disk, the changes made since
+        it was last written are applied again over the new contents unless they
+        could not be journalled, in which case they win over the changes on disk
+        """
+        if self.__needs_snapshot:
+            return True
+        pending_ops = self.__pending_ops
+        loaded = self.load_series(dirpath)
+        for op in pending_ops:
+            self.__apply_op(op)
+        self.__pending_ops = pending_ops
+        return loaded
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.__loaded_from is not None
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self.__pending_ops) or self.__needs_snapshot
+
+    @staticmethod
+    def get_series_stamp(dirpath: str) -> Optional[Tuple[int, ...]]:
+        """
+        Size and modification time of the series db and journal in a directory,
+        or None when it has no series db
+        """
+        existing = find_series_db(dirpath)
+        if not existing:
+            return None
+        try:
+            db_stat = os.stat(existing[0])
+        except OSError:
+            return None
+        try:
+            journal_stat = os.stat(get_journal_path(dirpath))
+            journal: Tuple[int, ...] = (journal_stat.st_size, journal_stat.st_mtime_ns)
+        except OSError:
+            journal = (0, 0)
+        return (db_stat.st_size, db_stat.st_mtime_ns) + journal
+
+    def __find_entry(self, op: JournalOp) -> Optional[Entry]:
+        index = op.get("index", -1)
+        if 0 <= index < len(self.__video_db):
+            entry = self.__video_db[index]
+            if entry.media == op["media"] and entry.alias == op.get("alias"):
+                return entry
+        # earlier changes may have moved the entry
+        for entry in self.__video_db:
+            if entry.media == op["media"] and entry.alias == op.get("alias"):
+                return entry
+        return None
+
+    def __apply_op(self, op: JournalOp) -> None:
+        """
+        Apply a journalled change, every change can be applied again without
+        effect in case the journal outlived the snapshot that included it
+        """
+        kind = op.get("op")
+        if kind == "enqueue":
+            new_entry = Entry.from_dict(op["entry"])
+            if not self.__find_entry(
+                {"media": new_entry.media, "alias": new_entry.alias}
+            ):
+                self.__video_db.append(new_entry)
+            return
+
+        if kind == "dequeue":
+            self.__video_db = [
+                entry
+                for entry in self.__video_db
+                if entry.media != op["media"] or entry.alias != op.get("alias")
+            ]
+            return
+
+        entry = self.__find_entry(op)
+        if not entry:
+            return
+        if kind == "view":
+            viewing = Viewing.from_dict(op["viewing"])
+            if not any(
+                existing.start.raw == viewing.start.raw
+                and existing.end.raw == viewing.end.raw
+                for existing in entry.viewings
+            ):
+                entry.add_viewing(viewing)
+        elif kind == "set":
+            if op["field"] == "duration":
+                entry.formatted_duration = op["value"]
+            elif op["field"] == "comment":
+                entry.comment = op["value"]
+            elif op["field"] == "title":
+                entry.title = op["value"]
+
+    def __log_op(self, kind: str, entry: Entry, **fields: Any) -> None:
+        try:
+            index = self.__video_db.index(entry)
+        except ValueError:
+            index = -1
+        op = {"op": kind, "index": index, "media": entry.media}
+        if entry.alias:
+            op["alias"] = entry.alias
+        op.update(fields)
+        self.__pending_ops.append(op)
+
+    def record_viewing(
+        self,
+        entry: Entry,
+        viewing: Viewing,
+        formatted_duration: Optional[str] = None,
+        comment: Optional[str] = None,
+        title: Optional[str] = None,
+    ) -> None:
+        """
+        Add a viewing to a show in the series and update its details, the
+        changes are journalled so writing the series does not rewrite the db
+        """
+        if formatted_duration is not None:
+            entry.formatted_duration = formatted_duration
+            self.__log_op("set", entry, field="duration", value=formatted_duration)
+        if comment is not None:
+            entry.comment = comment
+            self.__log_op("set", entry, field="comment", value=comment)
+        if title is not None:
+            entry.title = title
+            self.__log_op("set", entry, field="title", value=title)
+        entry.add_viewing(viewing)
+        self.__log_op("view", entry, viewing=viewing.to_dict())
+
     @staticmethod
     def path_has_series_db(dirpath: str) -> bool:
-        db_path = Db.get_series_db_path(dirpath)
-        return os.path.isfile(db_path)
+        return find_series_db(dirpath) is not None
 
-    def get_next_index_in_series(self):
-        for idx, show in enumerate(self.__video_db):
-            viewings = show.get("viewings", None)
-            if not viewings:
-                return idx
+    @staticmethod
+    def get_series_cursor_path(dirpath: str) -> str:
+        return os.path.join(dirpath, ".videos.cursor")
+
+    @staticmethod
+    def __load_cursor(dirpath: str) -> Optional[Tuple[int, str]]:
+        try:
+            with open(Db.get_series_cursor_path(dirpath), "r") as stream:
+                index, fingerprint = stream.read().split()
+                return int(index), fingerprint
+        except (OSError, ValueError):
+            return None
 
-            # get duration component of end field
-            final_viewing = viewings[-1]["end"].split(" at ")[1]
+    def __save_cursor(self, dirpath: str) -> None:
+        self.get_next_index_in_series()
+        if not self.__cursor:
+            return
+        index, fingerprint = self.__cursor
+        try:
+            with open(Db.get_series_cursor_path(dirpath), "w") as stream:
+                stream.write(f"{index} {fingerprint}\n")
+        except OSError:
+            # the cursor is only an optimisation, e.g. the directory may be
+            # read-only even though the series db is writable
+            pass
 
-            # if the final viewing didn't complete the show then it is next
-            if final_viewing != "finished?" and final_viewing != show.get(
-                "duration", None
+    def __get_cursor_fingerprint(self, index: int) -> Optional[str]:
+        if index < len(self.__video_db):
+            return _get_entry_fingerprint(self.__video_db[index])
+        elif index == len(self.__video_db):
+            return f"complete:{index}"
+        else:
+            return None
+
+    def get_next_index_in_series(self):
+        start = 0
+        if self.__cursor:
+            index, fingerprint = self.__cursor
+            if fingerprint == self.__get_cursor_fingerprint(index):
+                return index if index < len(self.__video_db) else None
+            elif index < len(self.__video_db) and fingerprint.startswith(
+                _get_media_fingerprint(self.__video_db[index])
             ):
+                # a viewing was recorded for the show at the cursor, every show
+                # before it is still finished so continue the scan from there
+                start = index
+
+        for idx in range(start, len(self.__video_db)):
+            if not self.__video_db[idx].is_finished():
+                self.__cursor = (idx, _get_entry_fingerprint(self.__video_db[idx]))
                 return idx
 
+        count = len(self.__video_db)
+        self.__cursor = (count, f"complete:{count}")
         return None
 
-    def get_next_in_series(self):
+    def get_next_in_series(self, load_aliased=True):
         next_index = self.get_next_index_in_series()
         if next_index is None:
             return None
         else:
             next_entry = self.__video_db[next_index]
-            alias = next_entry.get("alias", None)
-            if alias:
-                self.aliased_db = Db()
-                self.aliased_db.load_series(alias)
+            if next_entry.alias and load_aliased:
+                if self.__registry and self.__loaded_from:
+                    self.aliased_db = self.__registry.get_aliased(
+                        self.__loaded_from, next_entry.alias
+                    )
+                else:
+                    self.aliased_db = Db()
+                    self.aliased_db.load_series(next_entry.alias)
             return next_entry
 
+    def iter_unwatched_in_series(self) -> Iterator[Entry]:
+        """
+        Yield the next show in the series followed by every later show that
+        has not been finished
+        """
+        next_index = self.get_next_index_in_series()
+        if next_index is None:
+            return
+        for entry in self.__video_db[next_index:]:
+            if not entry.is_finished():
+                yield entry
+
     def prune_watched(self):
         next_index = self.get_next_index_in_series()
         if next_index:
             self.__video_db = self.__video_db[next_index:]
+            self.__cursor = None
+            self.__needs_snapshot = True
 
-    def add_show_to_series(self, video_data):
-        self.__video_db.append(video_data)
+    def add_show_to_series(self, entry: Entry):
+        self.__video_db.append(entry)
+        self.__pending_ops.append({"op": "enqueue", "entry": entry.to_dict()})
 
-    def write_series(self, dirpath):
-        filepath = Db.get_series_db_path(dirpath)
-        save_yaml_file(filepath, self.__video_db)
+    def merge_shows_into_series(self, entries: List[Entry]) -> List[Entry]:
+        """
+        Add the shows that are not already in the series, each is placed after
+        every show that has been watched and before the first unwatched show
+        whose media sorts after it, so existing shows keep their order.
+        Returns the shows that were added.
+        """
+        media_set = self.get_series_media_set()
+        entries = [entry for entry in entries if entry.media not in media_set]
+        if not entries:
+            return []
+
+        first_unwatched = len(self.__video_db)
+        while (
+            first_unwatched > 0
+            and not self.__video_db[first_unwatched - 1].viewing_count
+        ):
+            first_unwatched -= 1
+
+        merged = self.__video_db[:first_unwatched]
+        remaining = self.__video_db[first_unwatched:]
+        for entry in sorted(entries, key=lambda entry: entry.media):
+            while remaining and (
+                remaining[0].alias or remaining[0].media <= entry.media
+            ):
+                merged.append(remaining.pop(0))
+            merged.append(entry)
+        merged.extend(remaining)
+
+        self.__video_db = merged
+        self.__cursor = None
+        # inserting shows cannot be journalled
+        self.__needs_snapshot = True
+        return entries
+
+    def write_series(self, dirpath, archive=True):
+        """
+        Append the changes since the series was loaded to its journal, the
+        journal is compacted into a new snapshot of the db once it grows past
+        JOURNAL_COMPACT_THRESHOLD changes. Unless archive is False, old watched
+        queue entries are archived whenever a snapshot is written.
+        """
+        db_path, storage = get_series_db(dirpath)
+        journal_path = get_journal_path(dirpath)
+        if (
+            self.__needs_snapshot
+            or self.__loaded_from != os.path.abspath(dirpath)
+            or self.__journal_length + len(self.__pending_ops)
+            >= JOURNAL_COMPACT_THRESHOLD
+            or not os.path.isfile(db_path)
+        ):
+            archive_after_days = get_archive_after_days()
+            if archive and archive_after_days is not None:
+                self.archive_watched(
+                    dirpath, datetime.now() - timedelta(days=archive_after_days)
+                )
+            # the snapshot is on disk before the journal is removed, replaying
+            # the journal over it would have no effect so a crash before the
+            # journal is removed is harmless
+            storage.save(db_path, [entry.to_dict() for entry in self.__video_db])
+            remove_journal(journal_path)
+            self.__journal_length = 0
+        elif self.__pending_ops:
+            append_journal(journal_path, self.__pending_ops)
+            self.__journal_length += len(self.__pending_ops)
+
+        self.__pending_ops = []
+        self.__needs_snapshot = False
+        self.__loaded_from = os.path.abspath(dirpath)
+        self.__save_cursor(dirpath)
+
+    def archive_watched(self, dirpath: str, finished_before: datetime) -> int:
+        """
+        Move queue entries that were finished before a time into a compressed
+        archive segment, returns the number of entries archived. Only shows
+        before the next show in the series are archived, and only those that
+        are not files in the series directory, which create would add again.
+        """
+        next_index = self.get_next_index_in_series()
+        if next_index is None:
+            next_index = len(self.__video_db)
+
+        archived = []
+        kept = []
+        for index, entry in enumerate(self.__video_db):
+            if index < next_index and _is_archivable(entry, finished_before):
+                archived.append(entry)
+            else:
+                kept.append(entry)
+        if not archived:
+            return 0
+
+        # the archive is written first so a crash can not lose entries
+        write_archive_segment(dirpath, [entry.to_dict() for entry in archived])
+        self.__video_db = kept
+        self.__cursor = None
+        self.__needs_snapshot = True
+        return len(archived)
+
+    def restore_archived(self, dirpath: str) -> int:
+        """
+        Move every archived entry back to the front of the series, returns the
+        number of entries restored. Restored entries are marked with the time
+        they were restored, they are not archived again until that is old.
+        """
+        present = set((entry.alias, entry.media) for entry in self.__video_db)
+        restored_time = format_date(datetime.now())
+        restored = []
+        for entry in map(Entry.from_dict, iter_archived_entries(dirpath)):
+            if (entry.alias, entry.media) not in present:
+                present.add((entry.alias, entry.media))
+                entry.extra = dict(entry.extra or {}, **{RESTORED_FIELD: restored_time})
+                restored.append(entry)
+
+        self.__video_db = restored + self.__video_db
+        self.__cursor = None
+        self.__needs_snapshot = True
+        self.write_series(dirpath, archive=False)
+        remove_archive(dirpath)
+        return len(restored)
 
     def get_series_media_set(self):
-        return set(
-            map(
-                lambda entry: entry.get("video", entry.get("audio", None)),
-                self.__video_db,
-            )
-        )
+        return set(entry.media for entry in self.__video_db)
 
     @staticmethod
     def get_series_db_path(dirpath):
-        return os.path.join(dirpath, ".videos.yaml")
+        return get_series_db(dirpath)[0]
+
+    def migrate_series(self, dirpath: str, storage_name: str) -> Optional[str]:
+        """
+        Convert the series db in a directory to another storage, returns the
+        path of the new db or None when it already used that storage
+        """
+        existing = find_series_db(dirpath)
+        if not existing:
+            raise ValueError(f"no series db found in {dirpath}")
+        old_path, old_storage = existing
+        storage = get_storage(storage_name)
+        if storage is old_storage:
+            return None
+
+        self.load_series(dirpath)
+        new_path = os.path.join(dirpath, SERIES_DB_BASENAME + storage.extension)
+        storage.save(new_path, [entry.to_dict() for entry in self.__video_db])
+        os.remove(old_path)
+        remove_journal(get_journal_path(dirpath))
+        return new_path
+
+    @staticmethod
+    def iter_global_record(
+        prefilter: Optional[Pattern[bytes]] = None,
+    ) -> Iterator[MediaEntry]:
+        """
+        Yield records from the global record one at a time, only decoding those
+        that match the prefilter when it is given. Records from sealed segments
+        come first followed by those from the active segment.
+        """
+        record_path = Db.get_global_record_db_path()
+        yield from iter_sealed_records(record_path, prefilter)
+        yield from iter_yaml_list_file(record_path, prefilter)
+
+    @staticmethod
+    def search_global_record(
+        search: RecordSearch, jobs: Optional[int] = None
+    ) -> Iterator[MediaEntry]:
+        """
+        Yield records from the global record matching the search. Candidates are
+        looked up in the search index when the terms allow it, the index is
+        rebuilt if the global record has changed since it was last updated.
+        Otherwise the whole record is searched by jobs processes.
+        """
+        record_path = Db.get_global_record_db_path()
+        candidates = None
+        # rebuilding the index decodes the whole record in this process, which
+        # is only worth it when a term can be looked up in it
+        if any(get_literal_term(term) for term in search.terms):
+            index = RecordIndex(record_path)
+            try:
+                if not index.is_fresh():
+                    index.rebuild(Db.iter_global_record())
+                candidates = index.search(search.terms)
+            finally:
+                index.close()
+
+        if candidates is None:
+            return search_record(record_path, search, jobs)
+        else:
+            return filter(search.matches, candidates)
+
+    @staticmethod
+    def iter_global_record_between(
+        since: Optional[datetime], until: Optional[datetime]
+    ) -> Iterator[MediaEntry]:
+        """
+        Yield records that started within [since, until), only the part of the
+        global record inside the range is decoded
+        """
+        record_path = Db.get_global_record_db_path()
+        start, end = OffsetIndex(record_path).find_range(since, until)
+        segments = get_segments_between(record_path, since, until)
+        for record in itertools.chain(
+            iter_sealed_records(record_path, segments=segments),
+            iter_yaml_list_file(record_path, start=start, end=end),
+        ):
+            start_time = parse_date(record.get("start", "").split(" at ")[0])
+            if (
+                start_time
+                and (not since or start_time >= since)
+                and (not until or start_time < until)
+            ):
+                yield record
+
+    @staticmethod
+    def iter_global_record_last(count: int) -> Iterator[MediaEntry]:
+        if count <= 0:
+            return iter(())
+        record_path = Db.get_global_record_db_path()
+        start = OffsetIndex(record_path).find_last(count)
+        active_records = list(iter_yaml_list_file(record_path, start=start))
 
-    def load_global_record(self):
-        self.__video_db = load_yaml_file(Db.get_global_record_db_path())
+        # take the rest from the end of the sealed segments, newest first
+        sealed_records: Deque[MediaEntry] = deque()
+        for segment in reversed(load_manifest(record_path)):
+            missing = count - len(active_records) - len(sealed_records)
+            if missing <= 0:
+                break
+            records = list(iter_sealed_records(record_path, segments=[segment]))
+            sealed_records.extendleft(reversed(records[-missing:]))
+
+        return itertools.chain(sealed_records, active_records)
 
     def get_matching_entries(self, filter_expression):
         return filter(filter_expression, self.__video_db)
 
     def filter_db(self, filter_expression):
-        self.__video_db = list(self.get_matching_entries(filter_expression))
+        kept = []
+        for entry in self.__video_db:
+            if filter_expression(entry):
+                kept.append(entry)
+            else:
+                self.__log_op("dequeue", entry)
+        self.__video_db = kept
+        self.__cursor = None
+
+    @staticmethod
+    def append_global_record(record):
+        record_path = Db.get_global_record_db_path()
+        # a compaction running at the same time would lose the record
+        with lock_global_record(record_path):
+            finish_compaction(record_path)
+            index = RecordIndex(record_path)
+            offsets = OffsetIndex(record_path)
+            try:
+                # only update the indexes incrementally when they were in sync
+                # with the global record, otherwise they are rebuilt when next
+                # queried
+                index_was_fresh = index.is_fresh()
+                offset = offsets.get_append_offset()
+                save_yaml_file(record_path, [record], "a")
+                if index_was_fresh:
+                    index.add(record)
+                if offset is not None:
+                    offsets.add(offset, record.get("start", None))
+            finally:
+                index.close()
 
-    def append_global_record(self, record):
-        save_yaml_file(Db.get_global_record_db_path(), [record], "a")
+    @staticmethod
+    def compact_global_record(compression: str = DEFAULT_COMPRESSION):
+        return compact_global_record(Db.get_global_record_db_path(), compression)
 
     @staticmethod
     def get_global_record_db_path():
         return os.path.expanduser("~/.videorecord.yaml")
+
+
+class DbRegistry:
+    """
+    Hands out one Db per series directory for the duration of a command so
+    that each series db is only parsed once, a db is only loaded again when
+    it changed on disk. Every modified db is written once by flush.
+    """
+
+    def __init__(self):
+        self.__dbs: Dict[str, Tuple[Db, Optional[Tuple[int, ...]]]] = {}
+
+    def get(self, dirpath: str) -> Db:
+        """
+        The Db for the series in a directory, check is_loaded to find out
+        whether the directory has a series db
+        """
+        dirpath = os.path.realpath(dirpath)
+        stamp = Db.get_series_stamp(dirpath)
+        cached = self.__dbs.get(dirpath, None)
+        if cached:
+            db, loaded_stamp = cached
+            if stamp == loaded_stamp:
+                return db
+            db.reload_series(dirpath)
+        else:
+            db = Db(self)
+            db.load_series(dirpath)
+        self.__dbs[dirpath] = (db, stamp)
+        return db
+
+    def get_aliased(self, dirpath: str, alias: str) -> Db:
+        """
+        The Db of the series an entry in the series at dirpath is aliased to,
+        raises ValueError if the aliases of the next shows form a cycle
+        """
+        chain = [os.path.realpath(dirpath)]
+        aliased_path = os.path.realpath(os.path.join(dirpath, alias))
+        path = aliased_path
+        while True:
+            if path in chain:
+                raise ValueError("alias cycle: " + " -> ".join(chain + [path]))
+            chain.append(path)
+            next_entry = self.get(path).get_next_in_series(load_aliased=False)
+            if not next_entry or not next_entry.alias:
+                return self.get(aliased_path)
+            path = os.path.realpath(os.path.join(path, next_entry.alias))
+
+    def flush(self) -> None:
+        for dirpath, (db, _) in self.__dbs.items():
+            if db.is_dirty:
+                db.write_series(dirpath)
+                self.__dbs[dirpath] = (db, Db.get_series_stamp(dirpath))
@@ -0,0 +1,175 @@
+import sys
+import json
+import time
+from queue import Empty, Queue
+from threading import Thread
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from .config import Config
+from .yaml import yaml
+from .web import CACHE_NORMAL
+from .youtube import iter_youtube_search
+from .spotify import iter_spotify_search
+
+SOURCES = ("youtube", "spotify", "record")
+# seconds a source has to find its results, after which the rest are ignored
+DEFAULT_SOURCE_TIMEOUTS = {"youtube": 10.0, "spotify": 10.0, "record": 30.0}
+DEFAULT_FEDERATED_LIMIT = 20
+
+YOUTUBE_WATCH_URL = "https://www.youtube.com/watch?v="
+
+# yields the results of a source with the title, uri and text to rank each by
+SourceSearch = Callable[[], Iterator[Dict[str, Any]]]
+
+
+def _iter_youtube_results(config: Config, terms: List[str], limit: int, cache_mode):
+    for entry in iter_youtube_search(config, terms, limit=limit, cache_mode=cache_mode):
+        yield {
+            "uri": YOUTUBE_WATCH_URL + entry["id"],
+            "text": f"{entry['title']} {entry['channel title']}",
+            **entry,
+        }
+
+
+def _iter_spotify_results(config: Config, terms: List[str], limit: int, cache_mode):
+    for entry in iter_spotify_search(config, terms, limit=limit, cache_mode=cache_mode):
+        yield {
+            "title": entry["name"],
+            "text": " ".join(
+                str(entry.get(key, "")) for key in ("name", "artist", "album")
+            ),
+            **entry,
+        }
+
+
+def _iter_record_results(terms: List[str], limit: int):
+    # only needed by this source and slow to import
+    from .db import Db
+    from .search import RecordSearch, get_record_media
+
+    # searched in this thread as a process pool would be joined at exit, so a
+    # search that timed out would still delay babies from exiting
+    records = Db.search_global_record(RecordSearch(terms), jobs=1)
+    for count, record in enumerate(records):
+        if count == limit:
+            break
+        media = get_record_media(record)
+        yield {
+            "title": record.get("title", None) or media,
+            "uri": media,
+            "text": f"{media} {record.get('title', '')}",
+            **record,
+        }
+
+
+def _score(terms: List[str], text: str) -> float:
+    # the share of the words searched for that are in the result
+    words = [word for term in terms for word in term.lower().split()]
+    if not words:
+        return 0.0
+    text = text.lower()
+    return round(sum(word in text for word in words) / len(words), 2)
+
+
+def _run_source(results: Queue, source: str, search: SourceSearch) -> None:
+    error = None
+    try:
+        for result in search():
+            results.put((source, result, None))
+    except ValueError as err:
+        error = err.args[0] if err.args else str(err)
+    except Exception as err:
+        # any failure only loses the results of this source
+        error = f"{type(err).__name__}: {err}"
+    finally:
+        # None in place of a result when the source has finished
+        results.put((source, None, error))
+
+
+def _print_result(result: Dict[str, Any], output_format: str) -> None:
+    if output_format == "ndjson":
+        print(json.dumps(result, default=str), flush=True)
+    else:
+        # a list per result so the output is a single yaml list
+        yaml.dump([result], sys.stdout)
+        sys.stdout.flush()
+
+
+def search_everywhere(
+    config: Config,
+    search_terms: List[str],
+    sources=SOURCES,
+    limit=DEFAULT_FEDERATED_LIMIT,
+    timeout: Optional[float] = None,
+    cache_mode=CACHE_NORMAL,
+    output_format="yaml",
+):
+    """
+    Search youtube, spotify and the global record at once. Results are
+    printed as they arrive, those that arrive together ranked by how many of
+    the words searched for they contain. A source that has not finished
+    within its timeout is reported and its remaining results are ignored.
+    """
+    searches: Dict[str, SourceSearch] = {
+        "youtube": lambda: _iter_youtube_results(
+            config, search_terms, limit, cache_mode
+        ),
+        "spotify": lambda: _iter_spotify_results(
+            config, search_terms, limit, cache_mode
+        ),
+        "record": lambda: _iter_record_results(search_terms, limit),
+    }
+
+    results: Queue = Queue()
+    started = time.monotonic()
+    deadlines: Dict[str, float] = {}
+    for source in sources:
+        deadlines[source] = started + (timeout or DEFAULT_SOURCE_TIMEOUTS[source])
+        thread = Thread(target=_run_source, args=(results, source, searches[source]))
+        # a source that times out is left to finish without holding up exit
+        thread.daemon = True
+        thread.start()
+
+    running: Set[str] = set(sources)
+    result_count = 0
+    while running:
+        wait = max(0.0, min(deadlines[source] for source in running) - time.monotonic())
+        arrived = []
+        try:
+            arrived.append(results.get(timeout=wait))
+            while True:
+                arrived.append(results.get_nowait())
+        except Empty:
+            pass
+
+        ranked = []
+        for source, result, error in arrived:
+            if source not in running:
+                # arrived after the source timed out
+                continue
+            if result is None:
+                running.remove(source)
+                if error:
+                    print(f"{source}: {error}", file=sys.stderr)
+                continue
+            text = result.pop("text")
+            ranked.append(
+                {"source": source, "score": _score(search_terms, text), **result}
+            )
+
+        ranked.sort(key=lambda result: -result["score"])
+        for result in ranked:
+            _print_result(result, output_format)
+        result_count += len(ranked)
+
+        now = time.monotonic()
+        for source in list(running):
+            if now >= deadlines[source]:
+                running.remove(source)
+                print(
+                    f"{source}: timed out after {deadlines[source] - started:.1f}s",
+                    file=sys.stderr,
+                )
+
+    if not result_count and output_format == "yaml":
+        yaml.dump([], sys.stdout)
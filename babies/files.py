@@ -0,0 +1,68 @@
+import os
+import sys
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import IO, Any, Iterator, List
+
+
+def _sync_directory(dirpath: str) -> None:
+    fd = os.open(dirpath or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def write_atomically(filepath: str, mode="w", durable=True) -> Iterator[IO[Any]]:
+    """
+    A temporary file that replaces filepath once it has been written, so
+    readers and a crash only ever see the old or the new file. Each process
+    and thread writes its own temporary file. Unless durable is False, the
+    file is synced to disk before it replaces the old one and the directory
+    is synced after.
+    """
+    tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as stream:
+            yield stream
+            if durable:
+                stream.flush()
+                os.fsync(stream.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if durable:
+        _sync_directory(os.path.dirname(filepath))
+
+
+def read_lines(list_path: str) -> List[str]:
+    """
+    The lines of a file, or of stdin when list_path is "-", without surrounding
+    whitespace and skipping blank lines
+    """
+    if list_path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(list_path, "r") as stream:
+            lines = stream.readlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+@contextmanager
+def lock_file(lock_path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on the file at lock_path, which is created when it
+    does not exist, waiting for any other process holding it to release it
+    """
+    with open(lock_path, "a") as stream:
+        fcntl.flock(stream.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(stream.fileno(), fcntl.LOCK_UN)
@@ -1,4 +1,6 @@
 from math import floor
+from datetime import datetime
+from typing import Optional
 
 
 def format_duration(duration):
@@ -20,9 +22,26 @@ def format_duration(duration):
     )
 
 
+def parse_duration(duration: str) -> Optional[float]:
+    # inverse of format_duration, returns None when the duration is unknown
+    try:
+        hours, mins, secs = duration.split(":")
+        return float(hours) * 3600 + float(mins) * 60 + float(secs)
+    except ValueError:
+        return None
+
+
 def format_date(date):
     return str(date).replace("-", "/")
 
 
+def parse_date(formatted_date: str) -> Optional[datetime]:
+    # inverse of format_date, ignores fractions of a second
+    try:
+        return datetime.strptime(formatted_date.split(".")[0], "%Y/%m/%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
 def format_time_with_duration(time, duration):
     return format_date(time) + " at " + format_duration(duration)
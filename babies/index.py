@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import sqlite3
+from typing import Iterable, List, Optional, Pattern, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .db import MediaEntry
+
+# bump this when the schema changes to force a rebuild of existing indexes
+INDEX_VERSION = "1"
+
+_REGEX_SPECIAL_CHARS = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+def get_literal_term(term: str) -> Optional[str]:
+    # the trigram index can only look up plain ascii substrings of at least three
+    # characters, other terms have to be checked against every candidate instead
+    if len(term) < 3 or not term.isascii() or _REGEX_SPECIAL_CHARS.search(term):
+        return None
+    return term
+
+
+def get_prefilter(terms: List[str]) -> Optional[Pattern[bytes]]:
+    """
+    Build a regex that matches the raw yaml of every record that could match all
+    of the terms, or None when no term can be used to prefilter records
+    """
+    # quotes may be escaped in the yaml so terms containing them cannot be matched
+    literal_terms = [
+        term
+        for term in filter(None, map(get_literal_term, terms))
+        if not any(char in term for char in "\"'")
+    ]
+    if not literal_terms:
+        return None
+
+    longest_term = max(literal_terms, key=len)
+    return re.compile(re.escape(longest_term.encode()), re.IGNORECASE)
+
+
+def _get_file_fingerprint(filepath: str) -> Optional[str]:
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class RecordIndex:
+    """
+    Full-text trigram index of the global record stored in sqlite next to it
+    """
+
+    def __init__(self, record_path: str):
+        self.__record_path = record_path
+        self.__index_path = RecordIndex.get_index_path(record_path)
+        self.__connection: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def get_index_path(record_path: str) -> str:
+        return os.path.splitext(record_path)[0] + ".index.sqlite"
+
+    def __connect(self, create: bool) -> Optional[sqlite3.Connection]:
+        if self.__connection:
+            return self.__connection
+
+        if not create and not os.path.isfile(self.__index_path):
+            return None
+
+        try:
+            connection = sqlite3.connect(self.__index_path)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS records USING fts5("
+                "media, comment, title, record UNINDEXED, tokenize='trigram')"
+            )
+        except sqlite3.Error:
+            # sqlite was built without fts5 or the trigram tokenizer
+            return None
+
+        self.__connection = connection
+        return connection
+
+    def close(self) -> None:
+        if self.__connection:
+            self.__connection.close()
+            self.__connection = None
+
+    def __get_meta(self, connection: sqlite3.Connection, key: str) -> Optional[str]:
+        row = connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def __set_meta(self, connection: sqlite3.Connection, key: str, value) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def is_fresh(self) -> bool:
+        """
+        Whether the index exists and matches the global record on disk
+        """
+        connection = self.__connect(create=False)
+        if not connection:
+            return False
+        if self.__get_meta(connection, "version") != INDEX_VERSION:
+            return False
+        fingerprint = self.__get_meta(connection, "fingerprint")
+        return fingerprint == _get_file_fingerprint(self.__record_path)
+
+    def rebuild(self, records: Iterable["MediaEntry"]) -> bool:
+        connection = self.__connect(create=True)
+        if not connection:
+            return False
+
+        with connection:
+            connection.execute("DELETE FROM records")
+            connection.executemany(
+                "INSERT INTO records (media, comment, title, record) "
+                "VALUES (?, ?, ?, ?)",
+                map(_get_index_row, records),
+            )
+            self.__set_meta(connection, "version", INDEX_VERSION)
+            self.__set_meta(
+                connection, "fingerprint", _get_file_fingerprint(self.__record_path)
+            )
+        return True
+
+    def add(self, record: "MediaEntry") -> None:
+        """
+        Add a record that has just been appended to the global record, this must
+        only be called when the index was fresh before the append
+        """
+        connection = self.__connect(create=False)
+        if not connection:
+            return
+
+        with connection:
+            connection.execute(
+                "INSERT INTO records (media, comment, title, record) "
+                "VALUES (?, ?, ?, ?)",
+                _get_index_row(record),
+            )
+            self.__set_meta(
+                connection, "fingerprint", _get_file_fingerprint(self.__record_path)
+            )
+
+    def search(self, terms: List[str]) -> Optional[List["MediaEntry"]]:
+        """
+        Return records that could match all terms, or None when none of the terms
+        can be looked up in the index
+        """
+        connection = self.__connect(create=False)
+        if not connection:
+            return None
+
+        literal_terms = list(filter(None, map(get_literal_term, terms)))
+        if not literal_terms:
+            return None
+
+        query = " AND ".join(
+            'media : "' + term.replace('"', '""') + '"' for term in literal_terms
+        )
+        rows = connection.execute(
+            "SELECT record FROM records WHERE records MATCH ? ORDER BY rowid",
+            (query,),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+
+def _get_index_row(record: "MediaEntry") -> Tuple[str, str, str, str]:
+    return (
+        record.get("video", record.get("audio", "")),
+        record.get("comment", ""),
+        record.get("title", ""),
+        json.dumps(record, default=str),
+    )
@@ -1,6 +1,5 @@
 import sys
 import tty
-from readchar import readchar
 from typing import Callable
 import termios
 from threading import Thread
@@ -22,6 +21,9 @@ def _better_readchar():
         ch = sys.stdin.read(1)
         return ch
     else:
+        # only needed on platforms without termios and slow to import
+        from readchar import readchar
+
         readchar()
 
 
@@ -0,0 +1,74 @@
+import os
+import json
+from typing import Any, BinaryIO, Dict, List
+
+JournalOp = Dict[str, Any]
+
+# number of journalled changes after which the series db is rewritten
+JOURNAL_COMPACT_THRESHOLD = 64
+
+
+def get_journal_path(dirpath: str) -> str:
+    return os.path.join(dirpath, ".videos.journal")
+
+
+def read_journal(journal_path: str) -> List[JournalOp]:
+    ops: List[JournalOp] = []
+    try:
+        with open(journal_path, "r") as stream:
+            for line in stream:
+                try:
+                    ops.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a torn write from a crash can only affect the final line
+                    break
+    except FileNotFoundError:
+        pass
+    return ops
+
+
+def _end_final_line(stream: BinaryIO) -> None:
+    # a crash can leave the final line without its newline, which would join
+    # it to the next change appended so neither could be replayed
+    end = stream.seek(0, os.SEEK_END)
+    if not end:
+        return
+    stream.seek(end - 1)
+    if stream.read(1) == b"\n":
+        return
+
+    start = end
+    while start:
+        chunk_start = max(0, start - 4096)
+        stream.seek(chunk_start)
+        newline = stream.read(start - chunk_start).rfind(b"\n")
+        if newline != -1:
+            start = chunk_start + newline + 1
+            break
+        start = chunk_start
+
+    stream.seek(start)
+    try:
+        json.loads(stream.read())
+    except ValueError:
+        # only part of the change was written so it was never replayed
+        stream.truncate(start)
+    else:
+        # the change was replayed so it is kept
+        stream.write(b"\n")
+
+
+def append_journal(journal_path: str, ops: List[JournalOp]) -> None:
+    data = "".join(json.dumps(op, default=str) + "\n" for op in ops)
+    with open(journal_path, "a+b") as stream:
+        _end_final_line(stream)
+        stream.write(data.encode())
+        stream.flush()
+        os.fsync(stream.fileno())
+
+
+def remove_journal(journal_path: str) -> None:
+    try:
+        os.remove(journal_path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from xdg import BaseDirectory
+
+from .db import Db
+from .files import write_atomically
+from .scan import DirectoryScanner
+from .storage import SERIES_DB_BASENAME, STORAGES
+
+# next show in a series or None when the series is complete
+NextShow = Optional[Dict[str, str]]
+
+_SERIES_DB_FILES = frozenset(
+    SERIES_DB_BASENAME + storage.extension for storage in STORAGES.values()
+)
+
+
+def _scan_library_directory(
+    scanner: DirectoryScanner, dirpath: str
+) -> Tuple[Optional[str], List[str]]:
+    scanned = scanner.scan(dirpath)
+    if not scanned:
+        return None, []
+    files, subdirectories = scanned
+    db_path = None
+    for entry in files:
+        if entry.name in _SERIES_DB_FILES:
+            db_path = entry.path
+    return db_path, subdirectories
+
+
+def _load_next_show(dirpath: str) -> NextShow:
+    db = Db()
+    db.load_series(dirpath)
+    entry = db.get_next_in_series(load_aliased=False)
+    if not entry:
+        return None
+    next_show = {entry.media_type: entry.media}
+    if entry.alias:
+        next_show["alias"] = entry.alias
+    return next_show
+
+
+class NextShowCache:
+    """
+    The next show of every series that has been looked up, stored in a single
+    file in the user's cache directory along with the size and modification
+    time of the series db it was read from
+    """
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self.__cache_path = cache_path or os.path.join(
+            BaseDirectory.save_cache_path("babies"), "next.json"
+        )
+        self.__series: Dict[str, Any] = {}
+        try:
+            with open(self.__cache_path, "r") as stream:
+                self.__series = json.load(stream)
+        except (OSError, ValueError):
+            pass
+        self.__dirty = False
+
+    def get(self, db_path: str, stamp: List[int]) -> Tuple[bool, NextShow]:
+        cached = self.__series.get(db_path, None)
+        if cached and cached["stamp"] == stamp:
+            return True, cached["next"]
+        return False, None
+
+    def put(self, db_path: str, stamp: List[int], next_show: NextShow) -> None:
+        self.__series[db_path] = {"stamp": stamp, "next": next_show}
+        self.__dirty = True
+
+    def forget_missing(self, root: str, db_paths: Set[str]) -> None:
+        """
+        Forget series under root that were not found when it was scanned
+        """
+        prefix = os.path.join(root, "")
+        for db_path in list(self.__series):
+            if db_path.startswith(prefix) and db_path not in db_paths:
+                del self.__series[db_path]
+                self.__dirty = True
+
+    def save(self) -> None:
+        if not self.__dirty:
+            return
+        try:
+            with write_atomically(self.__cache_path, durable=False) as stream:
+                json.dump(self.__series, stream)
+            self.__dirty = False
+        except OSError:
+            # the cache is only an optimisation
+            pass
+
+
+def iter_next_in_library(
+    roots: List[str], jobs: Optional[int] = None, use_cache=True
+) -> Iterator[Tuple[str, NextShow]]:
+    """
+    Yield the directory and next show of every series below the roots as soon
+    as each is known. Directories are scanned by a pool of threads and series
+    that changed since they were cached are loaded by a pool of processes.
+    """
+    roots = [os.path.abspath(root) for root in roots]
+    jobs = jobs or os.cpu_count() or 1
+    cache = NextShowCache() if use_cache else None
+    db_paths: Set[str] = set()
+    directory_scanner = DirectoryScanner()
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 8)) as scanner:
+        with ProcessPoolExecutor(max_workers=jobs) as loader:
+            scans: Set[Future] = set(
+                scanner.submit(_scan_library_directory, directory_scanner, root)
+                for root in roots
+            )
+            loads: Dict[Future, Tuple[str, List[int]]] = {}
+
+            while scans or loads:
+                done, _ = wait(scans | set(loads), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in scans:
+                        scans.remove(future)
+                        db_path, subdirectories = future.result()
+                        scans.update(
+                            scanner.submit(
+                                _scan_library_directory,
+                                directory_scanner,
+                                subdirectory,
+                            )
+                            for subdirectory in subdirectories
+                        )
+                        if not db_path:
+                            continue
+                        dirpath = os.path.dirname(db_path)
+                        series_stamp = Db.get_series_stamp(dirpath)
+                        if not series_stamp:
+                            continue
+                        # a list as that is how it is stored in the cache
+                        stamp = list(series_stamp)
+                        db_paths.add(db_path)
+                        if cache:
+                            found, next_show = cache.get(db_path, stamp)
+                            if found:
+                                yield dirpath, next_show
+                                continue
+                        loads[loader.submit(_load_next_show, dirpath)] = (
+                            db_path,
+                            stamp,
+                        )
+                    else:
+                        db_path, stamp = loads.pop(future)
+                        try:
+                            next_show = future.result()
+                        except ValueError as e:
+                            print(f"{db_path}: {e}", file=sys.stderr)
+                            continue
+                        if cache:
+                            cache.put(db_path, stamp, next_show)
+                        yield os.path.dirname(db_path), next_show
+
+    if cache:
+        for root in roots:
+            cache.forget_missing(root, db_paths)
+        cache.save()
@@ -1,15 +1,25 @@
 import sys
 import os
-import re
-import ffmpeg
-from typing import List, Union, Tuple, Optional
-from datetime import datetime
-
-from .formatting import format_duration, format_time_with_duration
-from .videos import watch_video
-from .spotify import listen_to_track
+import itertools
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Union, Tuple, Optional
+from datetime import datetime, timedelta
+
+from .formatting import format_duration, parse_duration
+from .videos import BingeVideo, binge_videos, watch_video
+from .spotify import (
+    expand_spotify_collections,
+    is_spotify_collection,
+    listen_to_track,
+)
+from .config import Config
 from .input import ReadInput
-from .db import Db, MediaEntry
+from .db import Db, DbRegistry, Entry, MediaEntry, SessionTime, Viewing
+from .search import RecordSearch, get_record_media
+from .archive import get_archive_after_days, iter_archived_entries
+from .library import iter_next_in_library
+from .probe import probe_duration, probe_durations, remember_duration
+from .scan import DirectoryScanner
 from .yaml import yaml
 
 SHOW_EXTENSIONS = [
@@ -27,6 +37,10 @@ SHOW_EXTENSIONS = [
     "webm",
 ]
 
+# below this many series their dbs are parsed without starting any processes,
+# as starting the pool takes longer than parsing a few dbs
+PARALLEL_ENQUEUE_MIN_SERIES = 8
+
 
 def _is_url(path: str) -> bool:
     return path.startswith("https://") or path.startswith("http://")
@@ -36,20 +50,15 @@ def _is_spotify(path: str) -> bool:
     return path.startswith("spotify:")
 
 
-def _get_media_path(media_entry: MediaEntry) -> str:
-    video = media_entry.get("video", None)
-    return video or media_entry["audio"]
-
-
 def _get_media_entry_for_log(media_path: str) -> str:
     return media_path if _is_url(media_path) else os.path.basename(media_path)
 
 
+_SHOW_EXTENSION_SET = frozenset("." + extension for extension in SHOW_EXTENSIONS)
+
+
 def _is_video(path):
-    for suffix in SHOW_EXTENSIONS:
-        if path.endswith("." + suffix):
-            return True
-    return False
+    return os.path.splitext(path)[1] in _SHOW_EXTENSION_SET
 
 
 def _find_candidate_in_directory(path: str) -> str:
@@ -65,35 +74,32 @@ def _find_candidate_in_directory(path: str) -> str:
         raise ValueError("multiple candidates: " + ", ".join(candidates))
 
 
+def _get_entry_media_path(path: str, media_entry: Entry) -> str:
+    if media_entry.is_audio or _is_url(media_entry.media):
+        return media_entry.media
+    elif media_entry.alias:
+        return os.path.join(path, media_entry.alias, media_entry.media)
+    else:
+        return os.path.join(path, media_entry.media)
+
+
 def _path_to_media(
-    db: Db, path: str, ignore_errors=False, verbose=False
-) -> Tuple[str, Optional[MediaEntry]]:
+    registry: DbRegistry, path: str, ignore_errors=False, verbose=False
+) -> Tuple[str, Optional[Entry]]:
     """
-        If path is a directory then load series into db and return next
-        unwatched show else return path to file
+    If path is a directory then load its series from the registry and return
+    next unwatched show else return path to file
     """
     if _is_url(path) or _is_spotify(path):
         return path, None
     elif os.path.isdir(path):
-        if db.load_series(path):
+        db = registry.get(path)
+        if db.is_loaded:
             media_entry = db.get_next_in_series()
             if not media_entry:
                 raise ValueError("series is complete")
 
-            audio = media_entry.get("audio", None)
-            if audio:
-                media_path = audio
-            else:
-                video = media_entry["video"]
-                alias = media_entry.get("alias", None)
-                if _is_url(video):
-                    media_path = video
-                elif alias:
-                    media_path = os.path.join(path, alias, video)
-                else:
-                    media_path = os.path.join(path, video)
-
-            return media_path, media_entry
+            return _get_entry_media_path(path, media_entry), media_entry
         else:
             return _find_candidate_in_directory(path), None
 
@@ -104,37 +110,32 @@ def _path_to_media(
 
 
 def record_media(path, comment):
-    db = Db()
-    media_path, media_entry = _path_to_media(db, path)
-    duration = format_duration(float(ffmpeg.probe(media_path)["format"]["duration"]))
+    registry = DbRegistry()
+    media_path, media_entry = _path_to_media(registry, path)
+    duration = probe_duration(media_path)
 
     video_filename = _get_media_entry_for_log(media_path)
-    start = "unknown at " + format_duration(0)
-    end = "unknown at " + duration
-    db.append_global_record(
+    start = SessionTime.at(None, 0)
+    end = SessionTime.at(None, duration)
+    Db.append_global_record(
         {
             "video": video_filename,
-            "duration": duration,
-            "start": start,
-            "end": end,
+            "duration": format_duration(duration),
+            "start": start.raw,
+            "end": end.raw,
             "comment": comment,
         }
     )
     print("recorded " + video_filename + " in global log with comment: " + comment)
 
     if media_entry:
-        media_entry["duration"] = duration
-        viewings = media_entry.setdefault("viewings", [])
-        viewings.append({"start": start, "end": end, "comment": comment})
-        db.write_series(path)
+        registry.get(path).record_viewing(
+            media_entry, Viewing(start, end, comment), format_duration(duration)
+        )
+        registry.flush()
         print("recorded " + video_filename + " in series log with comment: " + comment)
 
 
-def _parse_duration(duration):
-    hours, mins, secs = duration.split(":")
-    return float(hours) * 3600 + float(mins) * 60 + float(secs)
-
-
 def play_media(
     read_input: ReadInput,
     uri: str,
@@ -147,12 +148,12 @@ def play_media(
     if _is_spotify(uri):
         listen_to_track(read_input, uri)
     else:
-        db = Db()
-        media_path, media_entry = _path_to_media(db, uri)
+        registry = DbRegistry()
+        media_path, media_entry = _path_to_media(registry, uri)
         media_log_entry = _get_media_entry_for_log(media_path)
 
         start_time = datetime.now()
-        start_position = 0
+        start_position = 0.0
 
         if _is_spotify(media_path):
             position, formatted_duration, end_time = listen_to_track(
@@ -161,7 +162,7 @@ def play_media(
 
             if not dont_record:
                 _record_session(
-                    db,
+                    registry,
                     media_entry,
                     uri,
                     media_log_entry,
@@ -176,11 +177,20 @@ def play_media(
                     skip_global_record=True,
                 )
         else:
+            start_position = _get_start_position(media_entry)
+
+            next_video = None
             if media_entry:
-                viewings = media_entry.get("viewings", None)
-                if viewings:
-                    final_viewing = viewings[-1]["end"].split(" at ")[1]
-                    start_position = _parse_duration(final_viewing)
+                # the show after this one in the series is read ahead so it
+                # starts quickly from a network mount
+                current_video = _get_binge_video(0, uri, media_path, media_entry)
+                next_binge_video = _find_binge_video(registry, [uri], current_video)
+                if next_binge_video:
+                    next_video = (
+                        next_binge_video.video_path,
+                        next_binge_video.start_position,
+                        next_binge_video.duration,
+                    )
 
             watch_status = watch_video(
                 read_input,
@@ -190,13 +200,21 @@ def play_media(
                 start_position,
                 night_mode=night_mode,
                 sub_file=sub_file,
+                next_video=next_video,
             )
 
+            if watch_status and not _is_url(media_path):
+                # the player already read the duration so a later record of
+                # this file need not probe it
+                duration = parse_duration(watch_status[1])
+                if duration:
+                    remember_duration(media_path, duration)
+
             if watch_status and not dont_record:
                 position, formatted_duration, end_time = watch_status
 
                 _record_session(
-                    db,
+                    registry,
                     media_entry,
                     uri,
                     media_log_entry,
@@ -210,23 +228,138 @@ def play_media(
                 )
 
 
+def _get_start_position(media_entry: Optional[Entry]) -> float:
+    final_end = media_entry.final_viewing_end if media_entry else None
+    return (final_end.position or 0.0) if final_end else 0.0
+
+
+def _get_binge_video(
+    uri_index: int, uri: str, media_path: str, media_entry: Optional[Entry]
+) -> BingeVideo:
+    media_log_entry = _get_media_entry_for_log(media_path)
+    return BingeVideo(
+        media_path,
+        media_log_entry,
+        _get_start_position(media_entry),
+        media_entry.duration if media_entry else None,
+        (uri_index, uri, media_entry, media_log_entry),
+    )
+
+
+def _find_binge_video(
+    registry: DbRegistry, uris: List[str], after: Optional[BingeVideo]
+) -> Optional[BingeVideo]:
+    """
+    The video to watch after a video, which is the next unwatched show in the
+    same series or otherwise the next show at the following paths
+    """
+    uri_index = 0
+    if after:
+        uri_index, uri, after_entry, _ = after.source
+        if after_entry:
+            # assumes the video being watched will be finished
+            found_after = False
+            for entry in registry.get(uri).iter_unwatched_in_series():
+                if found_after:
+                    media_path = _get_entry_media_path(uri, entry)
+                    if _is_spotify(media_path):
+                        # mpv can not play spotify tracks so binging moves on
+                        # to the next path, the track is left for listen
+                        break
+                    return _get_binge_video(uri_index, uri, media_path, entry)
+                found_after = (entry.media, entry.alias) == (
+                    after_entry.media,
+                    after_entry.alias,
+                )
+        uri_index += 1
+
+    for uri_index in range(uri_index, len(uris)):
+        uri = uris[uri_index]
+        try:
+            media_path, media_entry = _path_to_media(registry, uri)
+        except ValueError as e:
+            print(f"{uri}: {e}", file=sys.stderr)
+            continue
+        if _is_spotify(media_path):
+            print(f"{uri}: can not binge spotify tracks", file=sys.stderr)
+            continue
+        return _get_binge_video(uri_index, uri, media_path, media_entry)
+
+    return None
+
+
+def binge_media(
+    read_input: ReadInput,
+    uris: List[str],
+    dont_record=False,
+    night_mode=False,
+    sub_file=None,
+    comment=None,
+    title=None,
+):
+    """
+    Watch the next show at each path one after another in the same player,
+    continuing through each series until it is complete or the user quits
+    """
+    registry = DbRegistry()
+    first_video = _find_binge_video(registry, uris, None)
+    if not first_video:
+        return
+
+    def on_video_end(
+        video: BingeVideo,
+        position: float,
+        formatted_duration: str,
+        start_time: datetime,
+        end_time: datetime,
+    ):
+        _, uri, media_entry, media_log_entry = video.source
+        if not _is_url(video.video_path):
+            duration = parse_duration(formatted_duration)
+            if duration:
+                remember_duration(video.video_path, duration)
+        if not dont_record:
+            _record_session(
+                registry,
+                media_entry,
+                uri,
+                media_log_entry,
+                start_time,
+                video.start_position,
+                end_time,
+                position,
+                formatted_duration,
+                comment=comment,
+                title=title,
+            )
+
+    binge_videos(
+        read_input,
+        first_video,
+        lambda video: _find_binge_video(registry, uris, video),
+        on_video_end,
+        night_mode=night_mode,
+        sub_file=sub_file,
+    )
+
+
 def _record_session(
-    db: Db,
-    media_entry: Optional[MediaEntry],
+    registry: DbRegistry,
+    media_entry: Optional[Entry],
     uri: str,
     media_log_entry: str,
     start_time: datetime,
-    start_position: int,
+    start_position: float,
     end_time: datetime,
-    position: int,
+    position: float,
     formatted_duration: str,
     comment=None,
     title=None,
     is_audio=False,
     skip_global_record=False,
 ):
-    start = format_time_with_duration(start_time, start_position)
-    end = format_time_with_duration(end_time, position)
+    start = SessionTime.at(start_time, start_position)
+    end = SessionTime.at(end_time, position)
 
     record: MediaEntry = {}
 
@@ -235,33 +368,31 @@ def _record_session(
     else:
         record["video"] = media_log_entry
 
-    record.update({"duration": formatted_duration, "start": start, "end": end})
+    record.update({"duration": formatted_duration, "start": start.raw, "end": end.raw})
 
     if comment:
         record["comment"] = comment
-    elif media_entry and "comment" in media_entry:
-        record["comment"] = media_entry["comment"]
+    elif media_entry and media_entry.comment is not None:
+        record["comment"] = media_entry.comment
 
     if title:
         record["title"] = title
-    elif media_entry and "title" in media_entry:
-        record["title"] = media_entry["title"]
+    elif media_entry and media_entry.title is not None:
+        record["title"] = media_entry.title
 
     if not skip_global_record:
         # append the global record first in case the series update fails due to full
         # disk or readonly mount etc.
-        db.append_global_record(record)
+        Db.append_global_record(record)
         print("recorded media in global record:", media_log_entry)
 
     if media_entry:
-        # reload database in case something was enqueued while the media
-        # was playing
-        db.load_series(uri)
+        # the registry reloads the series if something was enqueued while the
+        # media was playing
+        db = registry.get(uri)
         media_entry_backup = media_entry
         media_entry = db.get_next_in_series()
-        if not media_entry or _get_media_path(media_entry) != _get_media_path(
-            media_entry_backup
-        ):
+        if not media_entry or media_entry.media != media_entry_backup.media:
             print(
                 "Something changed while playing media, "
                 "not recording entry in series record",
@@ -269,42 +400,40 @@ def _record_session(
             )
             return
 
-        if media_entry.get("duration", None) != formatted_duration:
-            media_entry["duration"] = formatted_duration
-        if comment:
-            media_entry["comment"] = comment
-        if title:
-            media_entry["title"] = title
-        sessions = media_entry.setdefault("viewings", [])
-
-        sessions.append({"start": start, "end": end})
-        db.write_series(uri)
-        print("recorded media in series record:", media_log_entry)
+        db.record_viewing(
+            media_entry,
+            Viewing(start, end),
+            formatted_duration,
+            comment=comment or None,
+            title=title or None,
+        )
 
+        aliased_path = None
         if db.aliased_db:
-            # TODO: reload aliased_db in case it has changed?
             next_aliased_entry = db.aliased_db.get_next_in_series()
 
-            media_key = "audio" if is_audio else "video"
-            if next_aliased_entry[media_key] == media_entry[media_key]:  # type: ignore
-                next_aliased_entry["duration"] = formatted_duration
-                aliased_sessions = next_aliased_entry.setdefault("viewings", [])
-                aliased_sessions.append({"start": start, "end": end})
-                aliased_path = media_entry["alias"]
-                db.aliased_db.write_series(aliased_path)
-                print("recorded video in aliased series record:", aliased_path)
+            if next_aliased_entry and next_aliased_entry.media == media_entry.media:
+                db.aliased_db.record_viewing(
+                    next_aliased_entry, Viewing(start, end), formatted_duration
+                )
+                aliased_path = media_entry.alias
+
+        registry.flush()
+        print("recorded media in series record:", media_log_entry)
+        if aliased_path:
+            print("recorded video in aliased series record:", aliased_path)
 
 
 def print_path_to_media(
     paths: List[str], ignore_errors=False, verbose=False, no_extension_filter=False
 ):
-    db = Db()
+    registry = DbRegistry()
     logs: List[Union[str, dict]] = []
 
     for path in paths:
         try:
             media_path, _ = _path_to_media(
-                db, path, ignore_errors=ignore_errors, verbose=verbose
+                registry, path, ignore_errors=ignore_errors, verbose=verbose
             )
 
             if _is_spotify(media_path):
@@ -332,60 +461,117 @@ def print_path_to_media(
             print(log)
 
 
-def enqueue_media(queue_path, paths, comment=None, prune=False, title=None):
-    db = Db()
-    db.load_series(queue_path)
+def print_next_in_library(
+    roots: List[str], verbose=False, jobs: Optional[int] = None, use_cache=True
+):
+    for dirpath, next_show in iter_next_in_library(roots, jobs, use_cache):
+        if not next_show:
+            continue
+        media = next_show.get("video", None) or next_show["audio"]
+        if verbose:
+            yaml.dump([dict(path=dirpath, **next_show)], sys.stdout)
+        else:
+            print(f"{dirpath}: {_get_media_entry_for_log(media)}", flush=True)
+
+
+# media, alias and whether it is audio
+EnqueueCandidate = Tuple[str, Optional[str], bool]
+
+
+def _get_enqueue_candidates(path: str) -> List[EnqueueCandidate]:
+    """
+    Media that enqueueing path could add in order of preference, for a series
+    this is every unwatched show so the first that is not queued can be used
+    """
+    if _is_url(path) or _is_video(path):
+        return [(path, None, False)]
+    elif _is_spotify(path):
+        return [(path, None, True)]
+    elif os.path.isdir(path):
+        series_db = Db()
+        if series_db.load_series(path):
+            candidates: List[EnqueueCandidate] = []
+            for entry in series_db.iter_unwatched_in_series():
+                if entry.alias:
+                    break
+                candidates.append((entry.media, path, False))
+            return candidates
+        else:
+            return [(_find_candidate_in_directory(path), None, False)]
+    return []
+
+
+def expand_spotify_paths(paths: List[str]) -> List[str]:
+    """
+    The paths with each spotify album and playlist replaced by its tracks
+    """
+    collections = [path for path in paths if is_spotify_collection(path)]
+    if not collections:
+        return paths
+    expanded = expand_spotify_collections(Config(), collections)
+    return [track for path in paths for track in expanded.get(path, [path])]
+
+
+def enqueue_media(queue_path, paths, comment=None, prune=False, title=None, jobs=None):
+    # every track of an album or playlist is queued
+    paths = expand_spotify_paths(paths)
+    registry = DbRegistry()
+    db = registry.get(queue_path)
     new_entries = []
-    queue_media = db.get_series_media_set()
+
+    def get_queued_key(alias: Optional[str], media: str) -> Tuple[Optional[str], str]:
+        # aliases are relative to the queue and the same series can be written
+        # many ways, e.g. ../A, ../A/ or its absolute path
+        if alias:
+            alias = os.path.realpath(os.path.join(queue_path, alias))
+        return alias, media
+
+    # the same show may be queued from different series
+    queued = set(
+        get_queued_key(entry.alias, entry.media)
+        for entry in db.get_matching_entries(lambda _: True)
+    )
 
     if prune:
         db.prune_watched()
 
-    entry_template = {}
-    if comment:
-        entry_template["comment"] = comment
-    if title:
-        entry_template["title"] = title
-
-    def add_new_entry(media, alias=None, audio=False):
-        # don't allow duplicates
-        if media not in queue_media:
-            entry = entry_template.copy()
-            if audio:
-                entry["audio"] = media
-            else:
-                entry["video"] = media
-            if alias:
-                entry["alias"] = alias
-            new_entries.append(entry)
-            queue_media.add(media)
-            db.add_show_to_series(entry)
+    series_paths = list(filter(os.path.isdir, set(paths)))
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1 and len(series_paths) >= PARALLEL_ENQUEUE_MIN_SERIES:
+        # each series db is parsed in its own process
+        with ProcessPoolExecutor(max_workers=min(jobs, len(series_paths))) as executor:
+            resolved = dict(
+                zip(series_paths, executor.map(_get_enqueue_candidates, series_paths))
+            )
+    else:
+        resolved = {path: _get_enqueue_candidates(path) for path in series_paths}
 
     for path in paths:
-        if _is_url(path) or _is_video(path):
-            add_new_entry(path)
-        elif _is_spotify(path):
-            add_new_entry(path, audio=True)
-        elif os.path.isdir(path):
-            series_db = Db()
-            if series_db.load_series(path):
-                # TODO: skip entries that are already enqueued, e.g.
-                # first queue episode 1, then episode 2
-                next_entry = series_db.get_next_in_series()
-                if next_entry and "alias" not in next_entry:
-                    add_new_entry(_get_media_path(next_entry), path)
-            else:
-                video = _find_candidate_in_directory(path)
-                add_new_entry(video)
+        candidates = resolved.get(path, None)
+        if candidates is None:
+            candidates = _get_enqueue_candidates(path)
+
+        # enqueueing a series more than once adds its following shows
+        for media, alias, audio in candidates:
+            queued_key = get_queued_key(alias, media)
+            if queued_key in queued:
+                continue
+            entry = Entry(media, "audio" if audio else "video", alias)
+            entry.comment = comment
+            entry.title = title
+            new_entries.append(entry.to_dict())
+            queued.add(queued_key)
+            db.add_show_to_series(entry)
+            break
 
     if new_entries:
-        db.write_series(queue_path)
+        registry.flush()
     yaml.dump(new_entries, sys.stdout)
 
 
 def dequeue_media(queue_path, paths):
-    db = Db()
-    db.load_series(queue_path)
+    registry = DbRegistry()
+    db = registry.get(queue_path)
     media_set = set()
     alias_set = set()
 
@@ -400,34 +586,185 @@ def dequeue_media(queue_path, paths):
                 media_set.add(video)
 
     db.filter_db(
-        lambda entry: _get_media_path(entry) not in media_set
-        and entry.get("alias", None) not in alias_set
+        lambda entry: entry.media not in media_set and entry.alias not in alias_set
     )
-    db.write_series(queue_path)
+    registry.flush()
 
 
-def grep_media_record(terms, quiet):
-    db = Db()
-    db.load_global_record()
-    matches = db.get_matching_entries(
-        lambda record: all(
-            re.search(term, _get_media_path(record), re.IGNORECASE) for term in terms
-        )
-    )
+def _print_media_records(records: Iterator[MediaEntry], quiet: bool):
+    # stream records as they are found rather than collecting them first
+    record_count = 0
+    for record in records:
+        record_count += 1
+        if quiet:
+            print(get_record_media(record))
+        else:
+            yaml.dump([record], sys.stdout)
+
+    if not quiet and not record_count:
+        yaml.dump([], sys.stdout)
+
+
+def grep_media_record(
+    terms: List[str],
+    quiet: bool,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    jobs: Optional[int] = None,
+):
+    search = RecordSearch(terms)
+    records: Iterator[MediaEntry]
+    if since or until:
+        records = filter(search.matches, Db.iter_global_record_between(since, until))
+    else:
+        records = Db.search_global_record(search, jobs)
+
+    _print_media_records(records, quiet)
+
+
+def print_media_record_log(count: int, quiet: bool):
+    _print_media_records(Db.iter_global_record_last(count), quiet)
 
-    if quiet:
-        print("\n".join(list(map(_get_media_path, matches))))
+
+def compact_media_record(compression: str):
+    segments = Db.compact_global_record(compression)
+    if not segments:
+        print("nothing to compact in global record")
     else:
-        yaml.dump(list(matches), sys.stdout)
+        yaml.dump(segments, sys.stdout)
+
 
+def archive_media(paths: List[str], days: Optional[int] = None):
+    if days is None:
+        days = get_archive_after_days()
+        if days is None:
+            raise ValueError("archiving is disabled by archive-after-days")
+    finished_before = datetime.now() - timedelta(days=days)
+    registry = DbRegistry()
+    for path in paths:
+        db = registry.get(path)
+        if not db.is_loaded:
+            raise ValueError(f"no series db found in {path}")
+        count = db.archive_watched(path, finished_before)
+        print(f"{path}: archived {count} entries")
+    registry.flush()
 
-def create_record_from_directory(db: Db, dirpath, force):
-    # TODO: merge new content with old content instead
-    if not force and os.path.isfile(Db.get_series_db_path(dirpath)):
-        raise ValueError("series record already exists")
 
-    for filename in sorted(os.listdir(dirpath)):
-        if _is_video(filename):
-            db.add_show_to_series({"video": filename})
+def restore_archived_media(paths: List[str]):
+    for path in paths:
+        db = Db()
+        db.load_series(path)
+        count = db.restore_archived(path)
+        print(f"{path}: restored {count} entries")
+
+
+def print_archived_media(paths: List[str], terms: List[str], quiet: bool):
+    search = RecordSearch(terms)
+    records = itertools.chain.from_iterable(
+        iter_archived_entries(path) for path in paths
+    )
+    _print_media_records(filter(search.matches, records), quiet)
+
+
+def migrate_media(paths: List[str], storage: str):
+    for path in paths:
+        db = Db()
+        new_path = db.migrate_series(path, storage)
+        if new_path:
+            print(f"migrated {path} to {new_path}")
+        else:
+            print(f"{path} already uses {storage} storage")
+
+
+def _scan_directory(
+    scanner: DirectoryScanner, dirpath: str
+) -> Optional[Tuple[List[str], List[str]]]:
+    scanned = scanner.scan(dirpath)
+    if not scanned:
+        return None
+    files, subdirectories = scanned
+    videos = [
+        entry.name
+        for entry in files
+        if not entry.name.startswith(".") and _is_video(entry.name) and entry.is_file()
+    ]
+    return sorted(videos), subdirectories
+
+
+def _scan_directories(
+    dirpaths: List[str], recursive: bool, jobs: Optional[int]
+) -> Dict[str, List[str]]:
+    """
+    Map each directory to the videos in it, the directories are listed
+    concurrently as each listing can be slow on a network mount
+    """
+    videos_by_directory: Dict[str, List[str]] = {}
+    scanner = DirectoryScanner()
+    with ThreadPoolExecutor(max_workers=jobs or 8) as executor:
+        pending: List[Tuple[str, Future]] = [
+            (dirpath, executor.submit(_scan_directory, scanner, dirpath))
+            for dirpath in dirpaths
+        ]
+        while pending:
+            dirpath, future = pending.pop(0)
+            scanned = future.result()
+            if not scanned:
+                continue
+            videos, subdirectories = scanned
+            videos_by_directory[dirpath] = videos
+            if recursive:
+                pending.extend(
+                    (
+                        subdirectory,
+                        executor.submit(_scan_directory, scanner, subdirectory),
+                    )
+                    for subdirectory in subdirectories
+                )
+    return videos_by_directory
+
+
+def create_records_from_directories(
+    dirpaths: List[str], force=False, recursive=False, probe=False, jobs=None
+):
+    """
+    Create a series db in each directory or add new shows to the existing one,
+    with recursive this is done for every directory under them that contains
+    shows. With probe the duration of each new show is filled in.
+    """
+    videos_by_directory = _scan_directories(dirpaths, recursive, jobs)
+    if recursive:
+        # a series db is not created in directories that only hold others
+        videos_by_directory = {
+            dirpath: videos for dirpath, videos in videos_by_directory.items() if videos
+        }
+
+    dbs: Dict[str, Db] = {}
+    new_entries: Dict[str, List[Entry]] = {}
+    for dirpath, videos in videos_by_directory.items():
+        db = Db()
+        if not force:
+            db.load_series(dirpath)
+        entries = db.merge_shows_into_series([Entry(video) for video in videos])
+        if not entries and Db.path_has_series_db(dirpath) and not force:
+            continue
+        dbs[dirpath] = db
+        new_entries[dirpath] = entries
+
+    if probe:
+        to_probe = [
+            (dirpath, entry)
+            for dirpath, entries in new_entries.items()
+            for entry in entries
+        ]
+        durations = probe_durations(
+            [os.path.join(dirpath, entry.media) for dirpath, entry in to_probe],
+            jobs=jobs,
+            ignore_errors=True,
+        )
+        for (_, entry), duration in zip(to_probe, durations):
+            entry.duration = duration
 
-    db.write_series(dirpath)
+    # every series db is written once after all of its shows are known
+    for dirpath, db in dbs.items():
+        db.write_series(dirpath)
+        print(f"{dirpath}: added {len(new_entries[dirpath])} shows")
@@ -0,0 +1,126 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, Optional
+
+PLAYER_URI = "org.mpris.MediaPlayer2.Player"
+PROPERTIES_URI = "org.freedesktop.DBus.Properties"
+MPRIS_OBJECT_PATH = "/org/mpris/MediaPlayer2"
+SPOTIFY_BUS_NAME = "org.mpris.MediaPlayer2.spotify"
+
+# the parts of the player state that are used: trackid, status and length in
+# seconds, a change only contains the parts that changed
+PlayerState = Dict[str, Any]
+StateHandler = Callable[[PlayerState], None]
+
+
+def _get_player_state(properties) -> PlayerState:
+    state: PlayerState = {}
+    if "Metadata" in properties:
+        metadata = properties["Metadata"]
+        state["trackid"] = str(metadata.get("mpris:trackid", ""))
+        state["length"] = metadata.get("mpris:length", 0) / 1000000
+    if "PlaybackStatus" in properties:
+        state["status"] = str(properties["PlaybackStatus"])
+    return state
+
+
+class PlayerBackend(ABC):
+    """
+    A media player that can be controlled over MPRIS
+    """
+
+    @abstractmethod
+    def open_uri(self, uri: str) -> None:
+        """
+        Start playing the track at uri
+        """
+
+    @abstractmethod
+    def stop(self) -> None:
+        """
+        Stop playback
+        """
+
+    @abstractmethod
+    def get_state(self) -> PlayerState:
+        """
+        The whole of the current player state
+        """
+
+    def subscribe(self, on_change: StateHandler) -> bool:
+        """
+        Call on_change from another thread with each change to the player
+        state, returns False when changes are not signalled so the state has
+        to be polled
+        """
+        return False
+
+
+@lru_cache(maxsize=None)
+def _get_dbus_mainloop() -> Optional[Any]:
+    # signals are only delivered while a glib main loop runs, which needs
+    # PyGObject so without it the player state is polled
+    try:
+        from dbus.mainloop.glib import DBusGMainLoop, threads_init
+        from gi.repository import GLib
+    except ImportError:
+        return None
+
+    threads_init()
+    dbus_mainloop = DBusGMainLoop()
+    mainloop_thread = Thread(target=GLib.MainLoop().run)
+    mainloop_thread.daemon = True
+    mainloop_thread.start()
+    return dbus_mainloop
+
+
+class DbusPlayerBackend(PlayerBackend):
+    """
+    An MPRIS player on the session bus, or on the bus at bus_address such as
+    a private bus running a fake player
+    """
+
+    def __init__(
+        self, bus_name: str = SPOTIFY_BUS_NAME, bus_address: Optional[str] = None
+    ):
+        # only loaded when a track is played as connecting to dbus is slow
+        import dbus
+
+        mainloop = _get_dbus_mainloop()
+        if bus_address:
+            bus = dbus.bus.BusConnection(bus_address, mainloop=mainloop)
+        else:
+            bus = dbus.SessionBus(mainloop=mainloop)
+        self.__signalled = mainloop is not None
+        self.__proxy = bus.get_object(bus_name, MPRIS_OBJECT_PATH)
+        self.__player = dbus.Interface(self.__proxy, dbus_interface=PLAYER_URI)
+        self.__properties = dbus.Interface(self.__proxy, dbus_interface=PROPERTIES_URI)
+        self.__bus_lock = Lock()
+
+    def open_uri(self, uri: str) -> None:
+        with self.__bus_lock:
+            self.__player.OpenUri(uri)
+
+    def stop(self) -> None:
+        with self.__bus_lock:
+            self.__player.Stop()
+
+    def get_state(self) -> PlayerState:
+        with self.__bus_lock:
+            return _get_player_state(self.__properties.GetAll(PLAYER_URI))
+
+    def subscribe(self, on_change: StateHandler) -> bool:
+        if not self.__signalled:
+            return False
+
+        def properties_changed(interface, changed, invalidated):
+            if interface == PLAYER_URI:
+                state = _get_player_state(changed)
+                if state:
+                    on_change(state)
+
+        self.__proxy.connect_to_signal(
+            "PropertiesChanged", properties_changed, dbus_interface=PROPERTIES_URI
+        )
+        return True
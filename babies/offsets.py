@@ -0,0 +1,177 @@
+import os
+import re
+import mmap
+import struct
+from datetime import datetime
+from typing import Optional, Tuple
+
+from .formatting import parse_date
+from .files import write_atomically
+from .yaml import iter_yaml_list_chunks
+
+# header: magic, version, size and mtime of the global record when last synced
+_HEADER = struct.Struct("<4sIQQ")
+_MAGIC = b"BBOF"
+_VERSION = 1
+
+# entry: start time in seconds since the epoch, byte offset of the record
+_ENTRY = struct.Struct("<qQ")
+
+_START_FIELD = re.compile(rb"^(?:- |  )start: (.+?) at ", re.MULTILINE)
+
+
+def _get_start_key(start: Optional[str], previous_key: int) -> int:
+    # records are appended in chronological order but some have an unknown start
+    # time, clamping keys to the previous key keeps the index sorted regardless
+    start_time = parse_date(start) if start else None
+    if not start_time:
+        return previous_key
+    return max(previous_key, int(start_time.timestamp()))
+
+
+def get_chunk_start(chunk: bytes) -> Optional[str]:
+    # read the start time of a record from its raw yaml without decoding it
+    match = _START_FIELD.search(chunk)
+    return match.group(1).decode(errors="replace") if match else None
+
+
+def _get_record_fingerprint(record_path: str) -> Tuple[int, int]:
+    try:
+        stat = os.stat(record_path)
+    except FileNotFoundError:
+        return 0, 0
+    return stat.st_size, stat.st_mtime_ns
+
+
+class OffsetIndex:
+    """
+    Sidecar index of the global record mapping the start time of each record to
+    its byte offset, stored as fixed size entries so it can be bisected on disk
+    """
+
+    def __init__(self, record_path: str):
+        self.__record_path = record_path
+        self.__index_path = os.path.splitext(record_path)[0] + ".offsets"
+
+    def __read_header(self) -> Optional[Tuple[int, int]]:
+        try:
+            with open(self.__index_path, "rb") as stream:
+                header = stream.read(_HEADER.size)
+        except FileNotFoundError:
+            return None
+
+        if len(header) != _HEADER.size:
+            return None
+        magic, version, size, mtime = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION:
+            return None
+        return size, mtime
+
+    def is_fresh(self) -> bool:
+        return self.__read_header() == _get_record_fingerprint(self.__record_path)
+
+    def rebuild(self) -> None:
+        with write_atomically(self.__index_path, "wb") as stream:
+            # the record may be appended to during the rebuild so store the
+            # fingerprint from before the scan, making the next reader rebuild
+            size, mtime = _get_record_fingerprint(self.__record_path)
+            stream.write(_HEADER.pack(_MAGIC, _VERSION, size, mtime))
+
+            key = 0
+            if size:
+                for offset, chunk in iter_yaml_list_chunks(
+                    self.__record_path, end=size
+                ):
+                    key = _get_start_key(get_chunk_start(chunk), key)
+                    stream.write(_ENTRY.pack(key, offset))
+
+    def get_append_offset(self) -> Optional[int]:
+        """
+        The offset the next appended record will be written at, or None when the
+        index is out of date and cannot be updated incrementally
+        """
+        header = self.__read_header()
+        if not header or header != _get_record_fingerprint(self.__record_path):
+            return None
+        return header[0]
+
+    def add(self, offset: int, start: Optional[str]) -> None:
+        """
+        Add a record that was appended at an offset previously returned by
+        get_append_offset
+        """
+        with open(self.__index_path, "r+b") as stream:
+            end = stream.seek(0, 2)
+            previous_key = 0
+            if end > _HEADER.size:
+                stream.seek(end - _ENTRY.size)
+                previous_key, _ = _ENTRY.unpack(stream.read(_ENTRY.size))
+                stream.seek(end)
+
+            stream.write(_ENTRY.pack(_get_start_key(start, previous_key), offset))
+            stream.seek(0)
+            size, mtime = _get_record_fingerprint(self.__record_path)
+            stream.write(_HEADER.pack(_MAGIC, _VERSION, size, mtime))
+
+    def __ensure_fresh(self) -> None:
+        if not self.is_fresh():
+            self.rebuild()
+
+    def find_range(
+        self, since: Optional[datetime], until: Optional[datetime]
+    ) -> Tuple[int, Optional[int]]:
+        """
+        Byte range of the global record containing every record that started
+        within [since, until), the end is None when the range extends to the end
+        of the record
+        """
+        self.__ensure_fresh()
+        with open(self.__index_path, "rb") as stream, mmap.mmap(
+            stream.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            count = (len(data) - _HEADER.size) // _ENTRY.size
+
+            def bisect(timestamp: datetime) -> int:
+                key = int(timestamp.timestamp())
+                low, high = 0, count
+                while low < high:
+                    middle = (low + high) // 2
+                    entry_key, _ = _ENTRY.unpack_from(
+                        data, _HEADER.size + middle * _ENTRY.size
+                    )
+                    if entry_key < key:
+                        low = middle + 1
+                    else:
+                        high = middle
+                return low
+
+            def get_offset(entry_index: int) -> Optional[int]:
+                if entry_index >= count:
+                    return None
+                _, offset = _ENTRY.unpack_from(
+                    data, _HEADER.size + entry_index * _ENTRY.size
+                )
+                return offset
+
+            start_index = bisect(since) if since else 0
+            start = get_offset(start_index)
+            if start is None:
+                # nothing started after since, return an empty range
+                return 0, 0
+            return start, get_offset(bisect(until)) if until else None
+
+    def find_last(self, count: int) -> int:
+        """
+        Offset of the record count records before the end of the global record
+        """
+        if count <= 0:
+            # the end of the record so no records are read
+            return _get_record_fingerprint(self.__record_path)[0]
+        self.__ensure_fresh()
+        with open(self.__index_path, "rb") as stream:
+            entry_count = (stream.seek(0, 2) - _HEADER.size) // _ENTRY.size
+            if count >= entry_count:
+                return 0
+            stream.seek(_HEADER.size + (entry_count - count) * _ENTRY.size)
+            _, offset = _ENTRY.unpack(stream.read(_ENTRY.size))
+            return offset
@@ -0,0 +1,150 @@
+import os
+import time
+from threading import Event, Thread
+from typing import List, Optional, Tuple
+
+from .config import DEFAULT_PREFETCH_SIZE, DEFAULT_PREFETCH_BANDWIDTH, get_user_config
+
+MEGABYTE = 1024 * 1024
+CHUNK_SIZE = MEGABYTE
+
+# part of the prefetch size read around the resume position
+RESUME_SHARE = 0.5
+
+
+def get_prefetch_options() -> Tuple[float, float]:
+    config = get_user_config()
+    if not config:
+        return DEFAULT_PREFETCH_SIZE, DEFAULT_PREFETCH_BANDWIDTH
+    return config.get_prefetch_options()
+
+
+class Prefetcher:
+    """
+    Warms the page cache with the start of a video and the region around the
+    position it will resume from, reading in a background thread that stays
+    under a bandwidth cap
+    """
+
+    def __init__(
+        self,
+        path: str,
+        resume_fraction: Optional[float] = None,
+        size: Optional[float] = None,
+        bandwidth: Optional[float] = None,
+    ):
+        default_size, default_bandwidth = get_prefetch_options()
+        self.path = path
+        self.__resume_fraction = resume_fraction
+        self.__size = int((default_size if size is None else size) * MEGABYTE)
+        self.__bandwidth = (
+            default_bandwidth if bandwidth is None else bandwidth
+        ) * MEGABYTE
+        self.__cancelled = Event()
+        self.__thread: Optional[Thread] = None
+        self.bytes_read = 0
+        self.elapsed = 0.0
+        self.cold_chunk_time: Optional[float] = None
+        self.warm_chunk_time: Optional[float] = None
+
+    def __get_regions(self, file_size: int) -> List[Tuple[int, int]]:
+        size = min(self.__size, file_size)
+        if not self.__resume_fraction:
+            return [(0, size)]
+
+        resume_length = int(size * RESUME_SHARE)
+        # start a little before the resume position as mpv seeks to a keyframe
+        resume_offset = max(
+            0, int(file_size * self.__resume_fraction) - resume_length // 4
+        )
+        resume_offset = min(resume_offset, file_size - resume_length)
+        return [(0, size - resume_length), (resume_offset, resume_length)]
+
+    def __read_region(self, fd: int, offset: int, length: int, started: float):
+        if hasattr(os, "posix_fadvise"):
+            # lets the kernel start reading ahead while the reads are throttled
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+
+        end = offset + length
+        while offset < end and not self.__cancelled.is_set():
+            chunk_started = time.monotonic()
+            data = os.pread(fd, min(CHUNK_SIZE, end - offset), offset)
+            if not data:
+                break
+            if self.cold_chunk_time is None:
+                self.cold_chunk_time = time.monotonic() - chunk_started
+            offset += len(data)
+            self.bytes_read += len(data)
+
+            if self.__bandwidth:
+                ahead = self.bytes_read / self.__bandwidth - (
+                    time.monotonic() - started
+                )
+                if ahead > 0:
+                    self.__cancelled.wait(ahead)
+
+    def __run(self) -> None:
+        started = time.monotonic()
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            file_size = os.fstat(fd).st_size
+            for offset, length in self.__get_regions(file_size):
+                self.__read_region(fd, offset, length, started)
+
+            if self.cold_chunk_time is not None and not self.__cancelled.is_set():
+                # reading the first chunk again shows what the prefetch saved
+                chunk_started = time.monotonic()
+                os.pread(fd, min(CHUNK_SIZE, file_size), 0)
+                self.warm_chunk_time = time.monotonic() - chunk_started
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+            self.elapsed = time.monotonic() - started
+
+    def start(self) -> None:
+        if not self.__size:
+            return
+        self.__thread = Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def cancel(self) -> None:
+        self.__cancelled.set()
+        if self.__thread:
+            self.__thread.join()
+
+    def report(self) -> Optional[str]:
+        if not self.bytes_read:
+            return None
+        megabytes = self.bytes_read / MEGABYTE
+        message = (
+            f"prefetch: {megabytes:.1f}MB of {os.path.basename(self.path)} "
+            f"in {self.elapsed:.1f}s ({megabytes / max(self.elapsed, 0.001):.1f}MB/s)"
+        )
+        if self.cold_chunk_time is not None and self.warm_chunk_time is not None:
+            message += (
+                f", first MB took {self.cold_chunk_time * 1000:.1f}ms cold"
+                f" and {self.warm_chunk_time * 1000:.1f}ms warm"
+            )
+        return message
+
+
+def prefetch_video(
+    path: str, start_position: float = 0.0, duration: Optional[float] = None
+) -> Optional[Prefetcher]:
+    """
+    Start prefetching a video when it is a local file and prefetching is
+    enabled, returns the prefetcher so it can be cancelled
+    """
+    if not get_prefetch_options()[0] or not os.path.isfile(path):
+        return None
+    resume_fraction = None
+    if start_position and duration:
+        resume_fraction = min(start_position / duration, 1.0)
+    prefetcher = Prefetcher(path, resume_fraction)
+    prefetcher.start()
+    return prefetcher
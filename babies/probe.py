@@ -0,0 +1,143 @@
+import os
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterable, List, Optional, cast
+from xdg import BaseDirectory
+
+from .files import write_atomically
+
+# maximum number of durations kept, the least recently used are evicted first
+PROBE_CACHE_MAX_ENTRIES = 20000
+
+# number of ffprobe processes run at once by probe_durations
+DEFAULT_PROBE_JOBS = min(8, (os.cpu_count() or 1) * 2)
+
+
+def _get_probe_key(path: str) -> Optional[str]:
+    # a file that is replaced or modified gets a different key
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{stat.st_ino}"
+
+
+class ProbeCache:
+    """
+    Durations read by ffprobe stored in the user's cache directory, keyed by
+    path, size, modification time and inode
+    """
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self.__cache_path = cache_path or os.path.join(
+            BaseDirectory.save_cache_path("babies"), "probe.json"
+        )
+        self.__durations: Optional[OrderedDict] = None
+        self.__dirty = False
+
+    def __load(self) -> OrderedDict:
+        if self.__durations is None:
+            try:
+                with open(self.__cache_path, "r") as stream:
+                    self.__durations = OrderedDict(json.load(stream))
+            except (OSError, ValueError):
+                # a missing or corrupt cache is rebuilt as files are probed
+                self.__durations = OrderedDict()
+        return self.__durations
+
+    def get(self, path: str) -> Optional[float]:
+        key = _get_probe_key(path)
+        durations = self.__load()
+        if key is None or key not in durations:
+            return None
+        # the new order is only saved along with the next new duration
+        durations.move_to_end(key)
+        return durations[key]
+
+    def put(self, path: str, duration: float) -> None:
+        key = _get_probe_key(path)
+        if key is None:
+            return
+        durations = self.__load()
+        durations[key] = duration
+        durations.move_to_end(key)
+        while len(durations) > PROBE_CACHE_MAX_ENTRIES:
+            durations.popitem(last=False)
+        self.__dirty = True
+
+    def save(self) -> None:
+        if not self.__dirty or self.__durations is None:
+            return
+        try:
+            with write_atomically(self.__cache_path, durable=False) as stream:
+                json.dump(list(self.__durations.items()), stream)
+            self.__dirty = False
+        except OSError:
+            # the cache is only an optimisation
+            pass
+
+
+@lru_cache(maxsize=None)
+def get_probe_cache() -> ProbeCache:
+    return ProbeCache()
+
+
+def _run_probe(path: str, ignore_errors=False) -> Optional[float]:
+    import ffmpeg
+
+    try:
+        return float(ffmpeg.probe(path)["format"]["duration"])
+    except (ffmpeg.Error, KeyError, ValueError):
+        if ignore_errors:
+            return None
+        raise ValueError(f"could not probe duration of {path}")
+
+
+def probe_duration(path: str) -> float:
+    """
+    Duration of the media at path in seconds, only running ffprobe when the
+    file has not been probed since it last changed
+    """
+    return cast(float, probe_durations([path], jobs=1)[0])
+
+
+def probe_durations(
+    paths: Iterable[str], jobs: Optional[int] = None, ignore_errors=False
+) -> List[Optional[float]]:
+    """
+    Durations of many media files in the same order as paths, the files that
+    are not in the cache are probed by up to jobs ffprobe processes at once.
+    With ignore_errors the duration of a file that cannot be probed is None.
+    """
+    paths = list(paths)
+    cache = get_probe_cache()
+    durations: List[Optional[float]] = [cache.get(path) for path in paths]
+    missing = [idx for idx, duration in enumerate(durations) if duration is None]
+
+    if missing:
+        try:
+            with ThreadPoolExecutor(max_workers=jobs or DEFAULT_PROBE_JOBS) as executor:
+                probed = executor.map(
+                    lambda path: _run_probe(path, ignore_errors),
+                    [paths[idx] for idx in missing],
+                )
+                for idx, duration in zip(missing, probed):
+                    durations[idx] = duration
+                    if duration is not None:
+                        cache.put(paths[idx], duration)
+        finally:
+            cache.save()
+
+    return durations
+
+
+def remember_duration(path: str, duration: float) -> None:
+    """
+    Store a duration that was found some other way, e.g. by the video player
+    """
+    cache = get_probe_cache()
+    if cache.get(path) is None:
+        cache.put(path, duration)
+        cache.save()
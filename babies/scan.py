@@ -0,0 +1,63 @@
+import os
+import sys
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class DirectoryScanner:
+    """
+    Lists the directories below some roots from any number of threads. Each
+    directory is only listed once however many symlinks lead to it, so
+    symlinks that loop back to a parent are not followed forever.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = Lock()
+        # the real path of every directory that has been or will be listed
+        self.__visited: Set[str] = set()
+        # the real path of each subdirectory found, so it need not be resolved
+        # again when it is listed
+        self.__realpaths: Dict[str, str] = {}
+
+    def __visit(self, realpath: str) -> bool:
+        with self.__lock:
+            if realpath in self.__visited:
+                return False
+            self.__visited.add(realpath)
+            return True
+
+    def scan(self, dirpath: str) -> Optional[Tuple[List[os.DirEntry], List[str]]]:
+        """
+        The entries of a directory that are not directories and the paths of
+        its subdirectories not listed before, hidden directories are skipped.
+        None when it was already listed, or when it can not be listed which is
+        reported.
+        """
+        with self.__lock:
+            realpath = self.__realpaths.pop(dirpath, None)
+        if realpath is None:
+            realpath = os.path.realpath(dirpath)
+            if not self.__visit(realpath):
+                return None
+
+        files = []
+        subdirectories = []
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        files.append(entry)
+                    elif not entry.name.startswith("."):
+                        if entry.is_symlink():
+                            subdirectory_realpath = os.path.realpath(entry.path)
+                        else:
+                            # cheaper than resolving each part of the path
+                            subdirectory_realpath = os.path.join(realpath, entry.name)
+                        if self.__visit(subdirectory_realpath):
+                            with self.__lock:
+                                self.__realpaths[entry.path] = subdirectory_realpath
+                            subdirectories.append(entry.path)
+        except OSError as err:
+            print(f"{dirpath}: {err.strerror or err}", file=sys.stderr)
+            return None
+        return files, subdirectories
@@ -0,0 +1,92 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from .index import get_prefilter
+from .yaml import split_yaml_list_file, iter_yaml_list_file
+from .segments import Segment, load_manifest, iter_sealed_records
+
+if TYPE_CHECKING:
+    from .db import MediaEntry
+
+# below this size the active record is searched without starting any processes
+PARALLEL_SEARCH_MIN_BYTES = 4 * 1024 * 1024
+
+# a task is either a sealed segment or a byte range of the active record
+SearchTask = Union[Segment, Tuple[int, int]]
+
+
+def get_record_media(record: "MediaEntry") -> str:
+    return record.get("video", None) or record["audio"]
+
+
+class RecordSearch:
+    """
+    Regular expression terms that must all match the media path of a record,
+    compiled once so they can be sent to worker processes
+    """
+
+    def __init__(self, terms: List[str]):
+        self.terms = terms
+        self.__patterns = [re.compile(term, re.IGNORECASE) for term in terms]
+        self.prefilter = get_prefilter(terms)
+
+    def matches(self, record: "MediaEntry") -> bool:
+        media = get_record_media(record)
+        return all(pattern.search(media) for pattern in self.__patterns)
+
+
+def _search_task(
+    record_path: str, search: RecordSearch, task: SearchTask
+) -> List["MediaEntry"]:
+    if isinstance(task, dict):
+        records = iter_sealed_records(record_path, search.prefilter, [task])
+    else:
+        start, end = task
+        records = iter_yaml_list_file(record_path, search.prefilter, start, end)
+    return list(filter(search.matches, records))
+
+
+def get_search_jobs(jobs: Optional[int]) -> int:
+    return jobs or os.cpu_count() or 1
+
+
+def search_record(
+    record_path: str, search: RecordSearch, jobs: Optional[int] = None
+) -> Iterator["MediaEntry"]:
+    """
+    Yield every record matching the search in order, the sealed segments and
+    byte ranges of the active record are searched by a pool of processes
+    """
+    jobs = get_search_jobs(jobs)
+    segments = load_manifest(record_path)
+
+    try:
+        active_size = os.path.getsize(record_path)
+    except FileNotFoundError:
+        active_size = 0
+
+    if jobs == 1 or (not segments and active_size < PARALLEL_SEARCH_MIN_BYTES):
+        yield from filter(
+            search.matches, iter_sealed_records(record_path, search.prefilter)
+        )
+        if active_size:
+            yield from filter(
+                search.matches, iter_yaml_list_file(record_path, search.prefilter)
+            )
+        return
+
+    tasks: List[SearchTask] = list(segments)
+    if active_size:
+        tasks.extend(split_yaml_list_file(record_path, jobs))
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        # map returns the results in task order, which is the record order
+        for matches in executor.map(
+            _search_task,
+            [record_path] * len(tasks),
+            [search] * len(tasks),
+            tasks,
+        ):
+            yield from matches
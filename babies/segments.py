@@ -0,0 +1,299 @@
+import os
+import gzip
+import hashlib
+import lzma
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, ContextManager, Deque, Dict, Iterable, Iterator, List
+from typing import Optional, Pattern, Tuple, TypeVar
+
+from .files import lock_file, write_atomically
+from .yaml import (
+    dump_yaml_bytes,
+    load_yaml_file,
+    load_yaml_chunk,
+    iter_yaml_list_chunks,
+    iter_yaml_list_buffer_chunks,
+)
+from .formatting import parse_date
+from .offsets import get_chunk_start
+
+MANIFEST_FILE = "manifest.yaml"
+# segments written by a compaction that has not finished
+PENDING_FILE = "pending.yaml"
+DEFAULT_COMPRESSION = "gzip"
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "lzma": ".xz", "zstd": ".zst"}
+
+# number of sealed segments to decompress ahead of the reader
+READ_AHEAD = os.cpu_count() or 4
+
+Segment = Dict[str, Any]
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def get_segments_path(record_path: str) -> str:
+    return os.path.splitext(record_path)[0] + ".d"
+
+
+def load_manifest(record_path: str) -> List[Segment]:
+    manifest_path = os.path.join(get_segments_path(record_path), MANIFEST_FILE)
+    try:
+        return load_yaml_file(manifest_path) or []
+    except FileNotFoundError:
+        return []
+
+
+def _get_compression(filename: str) -> str:
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if filename.endswith(extension):
+            return compression
+    raise ValueError(f"unknown compression for segment {filename}")
+
+
+def _compress(compression: str, data: bytes) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data)
+    elif compression == "lzma":
+        return lzma.compress(data)
+    elif compression == "zstd":
+        return _get_zstandard().ZstdCompressor(level=10).compress(data)
+    raise ValueError(f"unknown compression {compression}")
+
+
+def _decompress(compression: str, data: bytes) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(data)
+    elif compression == "lzma":
+        return lzma.decompress(data)
+    elif compression == "zstd":
+        return _get_zstandard().ZstdDecompressor().decompress(data)
+    raise ValueError(f"unknown compression {compression}")
+
+
+def _get_zstandard():
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        raise ValueError("zstd compression requires the zstandard package")
+    return zstandard
+
+
+def read_compressed_file(filepath: str) -> bytes:
+    # the compression is taken from the file extension
+    with open(filepath, "rb") as stream:
+        return _decompress(_get_compression(filepath), stream.read())
+
+
+def write_compressed_file(filepath: str, data: bytes) -> None:
+    _write_atomically(filepath, _compress(_get_compression(filepath), data))
+
+
+def read_segment(record_path: str, segment: Segment) -> bytes:
+    return read_compressed_file(
+        os.path.join(get_segments_path(record_path), segment["file"])
+    )
+
+
+def map_in_order(
+    function: Callable[[T], R], items: Iterable[T], jobs: int = READ_AHEAD
+) -> Iterator[R]:
+    """
+    Like map but runs function on up to jobs items concurrently, unlike
+    Executor.map it only runs ahead of the consumer by jobs items
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending: Deque = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_sealed_records(
+    record_path: str,
+    prefilter: Optional[Pattern[bytes]] = None,
+    segments: Optional[List[Segment]] = None,
+) -> Iterator[Any]:
+    """
+    Yield each record from the sealed segments in order, segments are read and
+    decompressed in parallel
+    """
+    if segments is None:
+        segments = load_manifest(record_path)
+
+    for data in map_in_order(lambda s: read_segment(record_path, s), segments):
+        for _, chunk in iter_yaml_list_buffer_chunks(data, prefilter):
+            yield from load_yaml_chunk(chunk)
+
+
+def get_segments_between(
+    record_path: str, since: Optional[datetime], until: Optional[datetime]
+) -> List[Segment]:
+    def overlaps(segment: Segment) -> bool:
+        first = parse_date(segment.get("first") or "")
+        last = parse_date(segment.get("last") or "")
+        if since and last and last < since:
+            return False
+        if until and first and first >= until:
+            return False
+        return True
+
+    return list(filter(overlaps, load_manifest(record_path)))
+
+
+def _group_chunks_by_month(
+    chunks: Iterable[Tuple[int, bytes]],
+) -> List[Tuple[Optional[str], List[bytes]]]:
+    groups: List[Tuple[Optional[str], List[bytes]]] = []
+    for _, chunk in chunks:
+        start = get_chunk_start(chunk)
+        start_time = parse_date(start) if start else None
+        # records with an unknown start are kept with the record before them
+        month = start_time.strftime("%Y-%m") if start_time else None
+        if groups and (not month or groups[-1][0] in (None, month)):
+            if month and groups[-1][0] is None:
+                groups[-1] = (month, groups[-1][1])
+            groups[-1][1].append(chunk)
+        else:
+            groups.append((month, [chunk]))
+    return groups
+
+
+def _write_atomically(filepath: str, data: bytes) -> None:
+    with write_atomically(filepath, "wb") as stream:
+        stream.write(data)
+
+
+def lock_global_record(record_path: str) -> ContextManager[None]:
+    """
+    Lock the global record against other processes appending to or compacting
+    it, the lock is held on a separate file as compacting replaces the record
+    """
+    return lock_file(os.path.splitext(record_path)[0] + ".lock")
+
+
+def _starts_with(filepath: str, size: int, digest: str) -> bool:
+    with open(filepath, "rb") as stream:
+        prefix = stream.read(size)
+    return len(prefix) == size and hashlib.sha256(prefix).hexdigest() == digest
+
+
+def finish_compaction(record_path: str) -> None:
+    """
+    Complete a compaction that was interrupted by a crash, the global record
+    must be locked. If the sealed records were already removed from the active
+    record their segments are added to the manifest, otherwise the segments
+    are discarded so no record is lost or appears twice.
+    """
+    segments_path = get_segments_path(record_path)
+    pending_path = os.path.join(segments_path, PENDING_FILE)
+    try:
+        pending = load_yaml_file(pending_path)
+    except FileNotFoundError:
+        return
+
+    manifest = load_manifest(record_path)
+    sealed_files = set(segment["file"] for segment in manifest)
+    new_segments = [
+        segment
+        for segment in pending["segments"]
+        if segment["file"] not in sealed_files
+    ]
+    if new_segments:
+        if _starts_with(record_path, pending["size"], pending["sha256"]):
+            for segment in new_segments:
+                try:
+                    os.remove(os.path.join(segments_path, segment["file"]))
+                except FileNotFoundError:
+                    pass
+        else:
+            _write_atomically(
+                os.path.join(segments_path, MANIFEST_FILE),
+                dump_yaml_bytes(manifest + new_segments),
+            )
+    os.remove(pending_path)
+
+
+def compact_global_record(
+    record_path: str, compression: str = DEFAULT_COMPRESSION
+) -> List[Segment]:
+    """
+    Move every record started before the current month from the active global
+    record into compressed per-month segments, returns the new segments
+    """
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"unknown compression {compression}")
+
+    with lock_global_record(record_path):
+        finish_compaction(record_path)
+        return _compact_global_record(record_path, compression)
+
+
+def _compact_global_record(record_path: str, compression: str) -> List[Segment]:
+    current_month = datetime.now().strftime("%Y-%m")
+    groups = _group_chunks_by_month(iter_yaml_list_chunks(record_path))
+    sealed_count = 0
+    for month, _ in groups:
+        if month is None or month >= current_month:
+            break
+        sealed_count += 1
+    if not sealed_count:
+        return []
+
+    segments_path = get_segments_path(record_path)
+    os.makedirs(segments_path, exist_ok=True)
+    manifest = load_manifest(record_path)
+    existing_files = set(segment["file"] for segment in manifest)
+    new_segments = []
+    sealed = hashlib.sha256()
+    sealed_size = 0
+
+    for month, chunks in groups[:sealed_count]:
+        filename = f"{month}.yaml{COMPRESSION_EXTENSIONS[compression]}"
+        suffix = 1
+        while filename in existing_files:
+            filename = f"{month}.{suffix}.yaml{COMPRESSION_EXTENSIONS[compression]}"
+            suffix += 1
+        existing_files.add(filename)
+
+        # raw chunks are copied as they are so sealing is lossless
+        data = b"".join(chunks)
+        sealed.update(data)
+        sealed_size += len(data)
+        _write_atomically(
+            os.path.join(segments_path, filename), _compress(compression, data)
+        )
+        new_segments.append(
+            {
+                "file": filename,
+                "first": get_chunk_start(chunks[0]),
+                "last": get_chunk_start(chunks[-1]),
+                "records": len(chunks),
+            }
+        )
+
+    # the sealed records are the start of the active record, they are removed
+    # from it before the manifest is written and the pending file lets
+    # finish_compaction tell which of the two was done before a crash
+    pending_path = os.path.join(segments_path, PENDING_FILE)
+    pending = {
+        "size": sealed_size,
+        "sha256": sealed.hexdigest(),
+        "segments": new_segments,
+    }
+    _write_atomically(pending_path, dump_yaml_bytes(pending))
+
+    with open(record_path, "rb") as stream:
+        stream.seek(sealed_size)
+        remaining = stream.read()
+    _write_atomically(record_path, remaining)
+
+    manifest_path = os.path.join(segments_path, MANIFEST_FILE)
+    _write_atomically(manifest_path, dump_yaml_bytes(manifest + new_segments))
+    os.remove(pending_path)
+
+    return new_segments
@@ -1,62 +1,328 @@
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from math import floor
-from typing import List, Optional, Tuple
-from datetime import datetime, timedelta
+from queue import Empty, Queue
 from threading import Lock
-import requests
-from requests.auth import HTTPBasicAuth
-import dbus
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta
 import time
 
 from .config import Config
 from .input import ReadInput
 from .yaml import yaml
 from .formatting import format_duration
+from .mpris import DbusPlayerBackend, PlayerBackend, PlayerState
+from .web import CACHE_NORMAL, request, request_json
+from .webcache import get_cached_json
+
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+SPOTIFY_API_URL = "https://api.spotify.com/v1"
+# a token is replaced this long before it expires so that it does not expire
+# during a request
+TOKEN_REFRESH_MARGIN = timedelta(minutes=1)
+# number of searches a batch makes at once
+DEFAULT_SEARCH_JOBS = 8
+# the most albums a request can look up and playlist tracks a page can have
+MAX_ALBUMS_PER_REQUEST = 20
+PLAYLIST_PAGE_SIZE = 100
+
+_SPOTIFY_COLLECTION = re.compile(r"spotify:(album|playlist):(\w+)")
+
+# seconds without a change before the player state is read, to catch a missed
+# signal or to poll for changes when they are not signalled
+SIGNALLED_POLL_INTERVAL = 2.0
+UNSIGNALLED_POLL_INTERVAL = 0.1
+
+
+class SpotifyTokens:
+    """
+    Hands out a spotify access token, the stored token is read once and a new
+    one is requested shortly before it expires
+    """
+
+    def __init__(self, config: Config):
+        self.__config = config
+        self.__lock = Lock()
+        self.__token: Optional[Tuple[str, datetime]] = None
+        self.__read_stored = False
+
+    def __is_fresh(self, token: Optional[Tuple[str, datetime]]) -> bool:
+        return token is not None and datetime.now() < token[1] - TOKEN_REFRESH_MARGIN
+
+    def get_token(self) -> str:
+        with self.__lock:
+            token = self.__token
+            if not self.__is_fresh(token) and not self.__read_stored:
+                token = self.__config.get_spotify_access_token()
+                self.__read_stored = True
+            if not token or not self.__is_fresh(token):
+                token = self.__request_token()
+            self.__token = token
+            return token[0]
+
+    def invalidate(self, access_token: str) -> None:
+        """
+        Forget a token that was rejected so a new one is requested
+        """
+        with self.__lock:
+            if self.__token and self.__token[0] == access_token:
+                self.__token = None
+
+    def __request_token(self) -> Tuple[str, datetime]:
+        client_id, client_secret = self.__config.get_spotify_client_id_and_secret()
+        response = request_json(
+            "POST",
+            SPOTIFY_TOKEN_URL,
+            data={"grant_type": "client_credentials"},
+            auth=(client_id, client_secret),
+        )
+        token = (
+            response["access_token"],
+            datetime.now() + timedelta(seconds=response["expires_in"]),
+        )
+        self.__config.save_spotify_access_token(*token)
+        return token
+
+
+def _get_spotify_api(
+    tokens: SpotifyTokens,
+    endpoint: str,
+    params,
+    cache_mode=CACHE_NORMAL,
+    cache_source="spotify",
+) -> Any:
+    """
+    Get from the spotify api or the response cache, when the token is rejected
+    it is replaced and the request made once more
+    """
+    url = SPOTIFY_API_URL + endpoint
+
+    def fetch(headers):
+        for attempt in range(2):
+            access_token = tokens.get_token()
+            response = request(
+                "GET",
+                url,
+                params=params,
+                headers={**headers, "Authorization": f"Bearer {access_token}"},
+            )
+            if response.status_code != 401:
+                break
+            tokens.invalidate(access_token)
+        return response
+
+    return get_cached_json(cache_source, url, params, fetch, cache_mode)
+
+
+def _search_spotify_query(
+    config: Config,
+    tokens: SpotifyTokens,
+    query: str,
+    limit=50,
+    raw=False,
+    cache_mode=CACHE_NORMAL,
+) -> Any:
+    results = _get_spotify_api(
+        tokens,
+        "/search",
+        {
+            "q": query,
+            "type": "album,artist,track,episode",
+            "limit": limit,
+            "market": config.get_spotify_market(),
+        },
+        cache_mode,
+    )
+    return results if raw else _format_spotify_results(results)
 
-PLAYER_URI = "org.mpris.MediaPlayer2.Player"
 
+def search_spotify(
+    config: Config,
+    search_terms: List[str],
+    limit=50,
+    raw=False,
+    cache_mode=CACHE_NORMAL,
+):
+    config.load()
+    results = _search_spotify_query(
+        config, SpotifyTokens(config), " ".join(search_terms), limit, raw, cache_mode
+    )
+    yaml.dump(results, sys.stdout)
 
-def search_spotify(config: Config, search_terms: List[str], limit=50, raw=False):
-    access_token = config.get_spotify_access_token()
+
+def iter_spotify_search(
+    config: Config, search_terms: List[str], limit=50, cache_mode=CACHE_NORMAL
+) -> Iterator[Any]:
     config.load()
+    yield from _search_spotify_query(
+        config, SpotifyTokens(config), " ".join(search_terms), limit, False, cache_mode
+    )
 
-    if not access_token:
-        [client_id, client_secret] = config.get_spotify_client_id_and_secret()
 
-        results = requests.post(
-            "https://accounts.spotify.com/api/token",
-            {"grant_type": "client_credentials"},
-            auth=HTTPBasicAuth(client_id, client_secret),
+def search_spotify_batch(
+    config: Config,
+    queries: List[str],
+    limit=50,
+    raw=False,
+    jobs=None,
+    cache_mode=CACHE_NORMAL,
+):
+    """
+    Run many searches at once over the shared connections, the results of
+    each query are printed in the order of the queries as soon as they and
+    those of the queries before them are known
+    """
+    config.load()
+    # shared so only the first search that is not cached requests a token
+    tokens = SpotifyTokens(config)
+
+    with ThreadPoolExecutor(max_workers=jobs or DEFAULT_SEARCH_JOBS) as executor:
+        all_results = executor.map(
+            lambda query: _search_spotify_query(
+                config, tokens, query, limit, raw, cache_mode
+            ),
+            queries,
         )
+        for query, results in zip(queries, all_results):
+            # a list per query so the output is a single yaml list
+            yaml.dump([{"query": query, "results": results}], sys.stdout)
+            sys.stdout.flush()
+
+
+def is_spotify_collection(uri: str) -> bool:
+    return bool(_SPOTIFY_COLLECTION.fullmatch(uri))
+
+
+def _get_remaining_pages(
+    executor: ThreadPoolExecutor,
+    tokens: SpotifyTokens,
+    endpoint: str,
+    params,
+    first_page,
+    cache_mode=CACHE_NORMAL,
+) -> List[Any]:
+    """
+    The items of every page of a list, the pages after the first are
+    requested at once as the first tells how many items there are
+    """
+    page_size = first_page["limit"]
+    offsets = range(len(first_page["items"]), first_page["total"], page_size)
+    pages = executor.map(
+        lambda offset: _get_spotify_api(
+            tokens,
+            endpoint,
+            {**params, "limit": page_size, "offset": offset},
+            cache_mode,
+            "spotify-collections",
+        ),
+        offsets,
+    )
+    return first_page["items"] + [item for page in pages for item in page["items"]]
 
-        json = results.json()
-        access_token = json["access_token"]
 
-        expires = datetime.now() + timedelta(seconds=json["expires_in"])
-        config.save_spotify_access_token(access_token, expires)
+def expand_spotify_collections(
+    config: Config, uris: List[str], cache_mode=CACHE_NORMAL
+) -> Dict[str, List[str]]:
+    """
+    The track uris of each album and playlist uri, in order. Albums are
+    looked up many to a request and the pages of tracks are requested at once.
+    """
+    config.load()
+    tokens = SpotifyTokens(config)
+    market = config.get_spotify_market()
+    album_ids: List[str] = []
+    playlist_ids: List[str] = []
+    for uri in dict.fromkeys(uris):
+        match = _SPOTIFY_COLLECTION.fullmatch(uri)
+        if not match:
+            raise ValueError(f"not a spotify album or playlist: {uri}")
+        collection_type, collection_id = match.groups()
+        (album_ids if collection_type == "album" else playlist_ids).append(
+            collection_id
+        )
 
-    results = requests.get(
-        "https://api.spotify.com/v1/search",
-        {
-            "q": " ".join(search_terms),
-            "type": "album,artist,track,episode",
-            "limit": limit,
-            "market": config.get_spotify_market(),
-        },
-        headers={"Authorization": f"Bearer {access_token}"},
-    )
+    expanded: Dict[str, List[str]] = {}
+    with ThreadPoolExecutor(max_workers=DEFAULT_SEARCH_JOBS) as executor:
+        album_batches = executor.map(
+            lambda ids: _get_spotify_api(
+                tokens,
+                "/albums",
+                {"ids": ",".join(ids), "market": market},
+                cache_mode,
+                "spotify-collections",
+            ),
+            [
+                album_ids[idx : idx + MAX_ALBUMS_PER_REQUEST]
+                for idx in range(0, len(album_ids), MAX_ALBUMS_PER_REQUEST)
+            ],
+        )
+        playlist_params = {
+            "limit": PLAYLIST_PAGE_SIZE,
+            "market": market,
+            "fields": "items(track(uri)),limit,total",
+        }
+        playlist_pages = executor.map(
+            lambda playlist_id: _get_spotify_api(
+                tokens,
+                f"/playlists/{playlist_id}/tracks",
+                {**playlist_params, "offset": 0},
+                cache_mode,
+                "spotify-collections",
+            ),
+            playlist_ids,
+        )
 
-    if raw:
-        yaml.dump(results.json(), sys.stdout)
-    else:
-        yaml.dump(_format_spotify_results(results.json()), sys.stdout)
+        for albums in album_batches:
+            # an album that does not exist is null
+            for album in filter(None, albums["albums"]):
+                tracks = _get_remaining_pages(
+                    executor,
+                    tokens,
+                    f"/albums/{album['id']}/tracks",
+                    {"market": market},
+                    album["tracks"],
+                    cache_mode,
+                )
+                expanded[f"spotify:album:{album['id']}"] = [
+                    track["uri"] for track in tracks
+                ]
+
+        for playlist_id, first_page in zip(playlist_ids, playlist_pages):
+            items = _get_remaining_pages(
+                executor,
+                tokens,
+                f"/playlists/{playlist_id}/tracks",
+                playlist_params,
+                first_page,
+                cache_mode,
+            )
+            # tracks that are no longer available have no track
+            expanded[f"spotify:playlist:{playlist_id}"] = [
+                item["track"]["uri"]
+                for item in items
+                if item.get("track") and item["track"].get("uri")
+            ]
+
+    for uri in uris:
+        if uri not in expanded:
+            raise ValueError(f"spotify album or playlist not found: {uri}")
+    return expanded
 
 
 def _format_spotify_results(results):
     outputs = []
     for album in results["albums"]["items"]:
-        # TODO:
-        pass
+        outputs.append(
+            {
+                "type": "album",
+                "artist": album["artists"][0]["name"] if album["artists"] else None,
+                "name": album["name"],
+                "total_tracks": album["total_tracks"],
+                "release_date": album["release_date"],
+                "uri": album["uri"],
+            }
+        )
 
     for track in results["tracks"]["items"]:
         artists = list(map(lambda a: a["name"], track["artists"]))
@@ -90,67 +356,66 @@ def _format_spotify_results(results):
 
 
 class SpotifyPlayer:
-    def __init__(self):
-        bus = dbus.SessionBus()
-        proxy = bus.get_object(
-            "org.mpris.MediaPlayer2.spotify", "/org/mpris/MediaPlayer2"
+    """
+    Follows the state of the spotify client as changes are signalled, which
+    are handled in order by the thread that waits on them. The whole state is
+    only read when no change has arrived for a while, either to catch a missed
+    signal or, when changes are not signalled, to poll for them.
+    """
+
+    def __init__(self, backend: Optional[PlayerBackend] = None):
+        self.__backend = backend or DbusPlayerBackend()
+        self.__changes: Queue = Queue()
+        signalled = self.__backend.subscribe(
+            lambda change: self.__changes.put((change, datetime.now()))
         )
-        self.player = dbus.Interface(proxy, dbus_interface=PLAYER_URI)
-        self.properties = dbus.Interface(
-            proxy, dbus_interface="org.freedesktop.DBus.Properties"
+        self.__poll_interval = (
+            SIGNALLED_POLL_INTERVAL if signalled else UNSIGNALLED_POLL_INTERVAL
         )
-        self.playing = None
-        self.bus_lock = Lock()
+        self.state = self.__backend.get_state()
+        self.playing: Optional[str] = None
+
+    def __wait_for(self, predicate: Callable[[PlayerState], bool]) -> datetime:
+        """
+        Apply changes to the state until predicate is true, returns when the
+        change that made it true happened
+        """
+        changed_at = datetime.now()
+        while not predicate(self.state):
+            try:
+                change, changed_at = self.__changes.get(timeout=self.__poll_interval)
+            except Empty:
+                change, changed_at = self.__backend.get_state(), datetime.now()
+            self.state = {**self.state, **change}
+        return changed_at
 
     def play_track(self, uri: str):
-        with self.bus_lock:
-            self.player.OpenUri(uri)
+        # changes from before the track was opened no longer matter
+        while not self.__changes.empty():
+            self.state = {**self.state, **self.__changes.get()[0]}
+        self.__backend.open_uri(uri)
         self.playing = uri
 
     def stop(self):
-        with self.bus_lock:
-            self.player.Stop()
-
-    def __get_metadata(self):
-        with self.bus_lock:
-            return self.properties.Get(PLAYER_URI, "Metadata")
-
-    def __get_playback_status(self):
-        with self.bus_lock:
-            return str(self.properties.Get(PLAYER_URI, "PlaybackStatus"))
-
-    def wait_for_track_to_start(self):
-        while True:
-            metadata = self.__get_metadata()
-            if (
-                str(metadata["mpris:trackid"]) == self.playing
-                and self.__get_playback_status() == "Playing"
-            ):
-                break
-            else:
-                time.sleep(0.05)
-
-    def get_duration(self):
-        while True:
-            metadata = self.__get_metadata()
-            length = metadata["mpris:length"] / 1000000
-            if length > 0:
-                return length
-            else:
-                # sometimes it takes a while after the track has started for
-                # the duration to be available
-                time.sleep(0.05)
-
-    def wait_for_track_to_end(self):
-        while True:
-            metadata = self.__get_metadata()
-            if (
-                str(metadata["mpris:trackid"]) != self.playing
-                or self.__get_playback_status() != "Playing"
-            ):
-                break
-            else:
-                time.sleep(0.1)
+        self.__backend.stop()
+
+    def wait_for_track_to_start(self) -> datetime:
+        return self.__wait_for(
+            lambda state: state.get("trackid") == self.playing
+            and state.get("status") == "Playing"
+        )
+
+    def get_duration(self) -> float:
+        # sometimes it takes a while after the track has started for the
+        # duration to be available
+        self.__wait_for(lambda state: state.get("length", 0) > 0)
+        return self.state["length"]
+
+    def wait_for_track_to_end(self) -> datetime:
+        return self.__wait_for(
+            lambda state: state.get("trackid") != self.playing
+            or state.get("status") != "Playing"
+        )
 
 
 player: Optional[SpotifyPlayer] = None
@@ -173,8 +438,7 @@ def listen_to_track(read_input: ReadInput, track_uri: str) -> Tuple[int, str, da
     read_input.start(handle_keypress)
 
     player.play_track(track_uri)
-    player.wait_for_track_to_start()
-    start_at = datetime.now()
+    start_at = player.wait_for_track_to_start()
     print(f"start: {track_uri}", flush=True)
 
     duration = player.get_duration()
@@ -182,10 +446,10 @@ def listen_to_track(read_input: ReadInput, track_uri: str) -> Tuple[int, str, da
     formatted_duration = format_duration(floor(duration))
     print(f"position: {format_duration(0)}/{formatted_duration}", flush=True)
 
-    player.wait_for_track_to_end()
+    end_at = player.wait_for_track_to_end()
 
     # spotify always returns 0 for the dbus position method so have to estimate it
-    position = min(duration, floor((datetime.now() - start_at).total_seconds()))
+    position = min(duration, floor((end_at - start_at).total_seconds()))
 
     # spotify client reports the song ends 1-3 seconds before it does
     seconds_from_end = duration - position
@@ -0,0 +1,68 @@
+import sys
+import time
+import builtins
+from importlib.util import resolve_name
+from typing import List, Tuple
+
+# modules that load native libraries or are slow to import, only the
+# subcommands that use them should import them
+HEAVY_MODULES = ("mpv", "dbus", "ffmpeg", "requests")
+
+
+class ImportProfiler:
+    """
+    Times each module imported while it is running by wrapping __import__.
+    The self time of a module does not include the modules it imported.
+    """
+
+    def __init__(self) -> None:
+        self.__original_import = builtins.__import__
+        # time spent importing other modules by each import in progress
+        self.__nested: List[float] = []
+        # name, self time, total time and depth of each module in the order
+        # their imports finished
+        self.timings: List[Tuple[str, float, float, int]] = []
+
+    def __resolve(self, name: str, globals, level: int) -> str:
+        if not level:
+            return name
+        package = (globals or {}).get("__package__")
+        try:
+            return resolve_name("." * level + name, package)
+        except (ImportError, ValueError):
+            return name
+
+    def __import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        fullname = self.__resolve(name, globals, level)
+        if fullname in sys.modules:
+            return self.__original_import(name, globals, locals, fromlist, level)
+
+        depth = len(self.__nested)
+        self.__nested.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self.__original_import(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - started
+            nested = self.__nested.pop()
+            if self.__nested:
+                self.__nested[-1] += total
+            self.timings.append((fullname, total - nested, total, depth))
+
+    def start(self) -> None:
+        builtins.__import__ = self.__import
+
+    def stop(self) -> None:
+        builtins.__import__ = self.__original_import
+
+    def report(self) -> str:
+        lines = [f"{'self ms':>9} {'total ms':>9}  module"]
+        for name, self_time, total, depth in self.timings:
+            lines.append(
+                f"{self_time * 1000:9.1f} {total * 1000:9.1f}  {'  ' * depth}{name}"
+            )
+        total = sum(timing[2] for timing in self.timings if not timing[3])
+        lines.append(f"imported {len(self.timings)} modules in {total * 1000:.1f}ms")
+        heavy = [module for module in HEAVY_MODULES if module in sys.modules]
+        lines.append("heavy modules loaded: " + (", ".join(heavy) or "none"))
+        return "\n".join(lines)
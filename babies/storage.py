@@ -0,0 +1,146 @@
+import os
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from .files import write_atomically
+from .yaml import load_yaml_file, dump_yaml_bytes
+from .config import DEFAULT_STORAGE, get_user_config
+
+if TYPE_CHECKING:
+    from .db import MediaEntry
+
+SERIES_DB_BASENAME = ".videos"
+
+
+class Storage(ABC):
+    """
+    Format used to store a series db, yaml is the default and the interchange
+    format but the others are much faster to load and save
+    """
+
+    extension = ""
+
+    @abstractmethod
+    def load(self, filepath: str) -> List["MediaEntry"]:
+        """
+        The entries of the series db at filepath
+        """
+
+    @abstractmethod
+    def save(self, filepath: str, entries: List["MediaEntry"]) -> None:
+        """
+        Replace the series db at filepath with the entries
+        """
+
+
+class YamlStorage(Storage):
+    extension = ".yaml"
+
+    def load(self, filepath: str) -> List["MediaEntry"]:
+        return load_yaml_file(filepath) or []
+
+    def save(self, filepath: str, entries: List["MediaEntry"]) -> None:
+        # replace the db in one step so a crash cannot leave it truncated
+        data = dump_yaml_bytes(entries)
+        with write_atomically(filepath, "wb") as stream:
+            stream.write(data)
+
+
+class JsonLinesStorage(Storage):
+    extension = ".jsonl"
+
+    def load(self, filepath: str) -> List["MediaEntry"]:
+        with open(filepath, "r") as stream:
+            try:
+                return [json.loads(line) for line in stream if line.strip()]
+            except json.JSONDecodeError as err:
+                raise ValueError(f"{filepath}: {err}")
+
+    def save(self, filepath: str, entries: List["MediaEntry"]) -> None:
+        with write_atomically(filepath) as stream:
+            for entry in entries:
+                stream.write(json.dumps(entry, default=str) + "\n")
+
+
+class SqliteStorage(Storage):
+    extension = ".sqlite"
+
+    def load(self, filepath: str) -> List["MediaEntry"]:
+        if not os.path.isfile(filepath):
+            # sqlite would create an empty db rather than fail
+            raise FileNotFoundError(filepath)
+
+        connection = sqlite3.connect(filepath)
+        try:
+            rows = connection.execute("SELECT data FROM entries ORDER BY position")
+            return [json.loads(row[0]) for row in rows]
+        except sqlite3.Error as err:
+            raise ValueError(f"{filepath}: {err}")
+        finally:
+            connection.close()
+
+    def save(self, filepath: str, entries: List["MediaEntry"]) -> None:
+        connection = sqlite3.connect(filepath)
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entries "
+                    "(position INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+                )
+                connection.execute("DELETE FROM entries")
+                connection.executemany(
+                    "INSERT INTO entries (position, data) VALUES (?, ?)",
+                    (
+                        (position, json.dumps(entry, default=str))
+                        for position, entry in enumerate(entries)
+                    ),
+                )
+        finally:
+            connection.close()
+
+
+STORAGES: Dict[str, Storage] = {
+    "yaml": YamlStorage(),
+    "jsonl": JsonLinesStorage(),
+    "sqlite": SqliteStorage(),
+}
+
+
+def get_storage(name: str) -> Storage:
+    storage = STORAGES.get(name, None)
+    if not storage:
+        raise ValueError(
+            f"unknown storage {name}, must be one of: " + ", ".join(STORAGES)
+        )
+    return storage
+
+
+def get_default_storage_name() -> str:
+    config = get_user_config()
+    return config.get_storage() if config else DEFAULT_STORAGE
+
+
+def find_series_db(dirpath: str) -> Optional[Tuple[str, Storage]]:
+    """
+    Path to and storage of the existing series db in a directory, if any
+    """
+    for storage in STORAGES.values():
+        db_path = os.path.join(dirpath, SERIES_DB_BASENAME + storage.extension)
+        if os.path.isfile(db_path):
+            return db_path, storage
+    return None
+
+
+def get_series_db(dirpath: str) -> Tuple[str, Storage]:
+    """
+    Path to and storage of the series db in a directory, using the configured
+    storage when the directory does not have a series db yet
+    """
+    existing = find_series_db(dirpath)
+    if existing:
+        return existing
+
+    storage = get_storage(get_default_storage_name())
+    return os.path.join(dirpath, SERIES_DB_BASENAME + storage.extension), storage
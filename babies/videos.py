@@ -1,14 +1,16 @@
-import mpv
 import os
-from threading import Thread, Condition
+import sys
+import time
+from queue import Queue
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
 from dataclasses import dataclass
 
 from .yaml import load_yaml_file
 from .logger import MpvLogger
 from .input import ReadInput
 from .formatting import format_duration
+from .prefetch import Prefetcher, prefetch_video
 
 OPTIONS_YAML_FILE = ".watch-options.yaml"
 
@@ -19,9 +21,17 @@ class Session:
     position: Optional[float]
 
 
-def _apply_watch_options(player, video_path) -> Tuple[Optional[str], Optional[str]]:
+WatchOptions = Tuple[Optional[str], Optional[str], Dict[str, Any]]
+
+
+def _read_watch_options(video_path) -> WatchOptions:
+    """
+    The commands to run before and after watching a video and the player
+    options from the watch options files in its directory and their parent
+    """
     run_before = None
     run_after = None
+    player_options = {}
 
     video_dir = os.path.dirname(video_path)
 
@@ -41,67 +51,104 @@ def _apply_watch_options(player, video_path) -> Tuple[Optional[str], Optional[st
         elif opt_name == "after":
             run_after = opt_val
         else:
-            player[opt_name] = opt_val
-
-    return run_before, run_after
-
-
-def _wait_for_duration_or_terminate(player):
-    done_condition = Condition()
-    data = {}
-
-    # get duration of video
-    def wait_for_duration():
-        def set_duration(x):
-            if x:
-                data["duration"] = x
-                return True
+            player_options[opt_name] = opt_val
 
-        player.wait_for_property("duration", set_duration, False)
-        with done_condition:
-            done_condition.notify_all()
+    return run_before, run_after, player_options
 
-    def wait_for_playback():
-        try:
-            player.wait_for_playback()
-        except mpv.ShutdownError:
-            pass
-        with done_condition:
-            done_condition.notify_all()
 
-    duration_thread = Thread(target=wait_for_duration)
-    playback_thread = Thread(target=wait_for_playback)
-    duration_thread.daemon = True
-    duration_thread.start()
-    playback_thread.start()
+def _apply_watch_options(player, video_path) -> Tuple[Optional[str], Optional[str]]:
+    run_before, run_after, player_options = _read_watch_options(video_path)
+    for opt_name, opt_val in player_options.items():
+        player[opt_name] = opt_val
+    return run_before, run_after
 
-    with done_condition:
-        done_condition.wait()
-        return data.get("duration")
 
+def _format_file_option(value: Any) -> str:
+    # per-file options are passed to mpv as strings
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, list):
+        return ",".join(map(str, value))
+    return str(value)
+
+
+def _get_file_options(player_options: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        opt_name: _format_file_option(opt_val)
+        for opt_name, opt_val in player_options.items()
+    }
+
+
+# events that end playback of a file
+END_EVENTS = ("end-file", "shutdown")
+PLAYER_EVENTS = ("file-loaded", "playback-restart") + END_EVENTS
+
+
+class PlayerEvents:
+    """
+    Property changes and events from mpv handled in order by the thread that
+    controls playback, mpv's event thread only puts them on a queue so no
+    thread is needed to wait for each of them. The time from creation until
+    the first of each event or non-empty property value is kept in timings.
+    """
+
+    def __init__(self, player, properties: Iterable[str]):
+        self.__queue: Queue = Queue()
+        self.__created = time.monotonic()
+        self.timings: Dict[str, float] = {}
+        # latest value of each property and None for each event seen
+        self.values: Dict[str, Any] = {}
+
+        def put(name: str, value: Any) -> None:
+            self.__queue.put((name, value, time.monotonic()))
+
+        for name in properties:
+            player.observe_property(name, put)
+        for event_type in PLAYER_EVENTS:
+            player.event_callback(event_type)(
+                lambda _, event_type=event_type: put(event_type, None)
+            )
+
+    @property
+    def ended(self) -> bool:
+        return any(event_type in self.values for event_type in END_EVENTS)
+
+    def next(self) -> Tuple[str, Any]:
+        name, value, received = self.__queue.get()
+        if name not in self.timings and (value or name in PLAYER_EVENTS):
+            self.timings[name] = received - self.__created
+        self.values[name] = value
+        return name, value
+
+    def wait_for(self, predicate: Callable[[], bool], on_event=None) -> None:
+        """
+        Handle events until predicate is true, on_event is called with the
+        name and value of each event
+        """
+        while not predicate():
+            name, value = self.next()
+            if on_event:
+                on_event(name, value)
+
+    def get_startup_report(self) -> Optional[str]:
+        if "duration" not in self.timings:
+            return None
+        message = f"startup: duration after {self.timings['duration']:.2f}s"
+        if "playback-restart" in self.timings:
+            first_frame = self.timings["playback-restart"]
+            message += f", first frame after {first_frame:.2f}s"
+        return message
 
-def register_pause_handler(player):
-    state = {"has_first": False}
 
-    def pause_handler(named, value):
-        if not state["has_first"]:
-            state["has_first"] = True
-        else:
-            print("pause: " + ("paused" if value else "resumed"), flush=True)
+def _print_pause(name: str, value: Any) -> None:
+    if name == "pause":
+        print("pause: " + ("paused" if value else "resumed"), flush=True)
 
-    player.observe_property("pause", pause_handler)
 
+def _create_player(logger: MpvLogger, night_mode=False, sub_file=None):
+    # loading libmpv is slow so it is only done when a video is played
+    import mpv
 
-def watch_video(
-    read_input: ReadInput,
-    path: str,
-    video_path: str,
-    display_video: str,
-    start_position: int,
-    night_mode=False,
-    sub_file=None,
-) -> Optional[Tuple[int, str, datetime]]:
-    logger = MpvLogger()
     player = mpv.MPV(
         log_handler=logger,
         input_default_bindings=True,
@@ -117,6 +164,38 @@ def watch_video(
     if sub_file:
         player["sub-files"] = sub_file
 
+    return player
+
+
+def _print_startup_report(events: PlayerEvents) -> None:
+    report = events.get_startup_report()
+    if report:
+        print(report, flush=True)
+
+
+def _print_prefetch_report(prefetcher: Optional[Prefetcher]) -> None:
+    report = prefetcher.report() if prefetcher else None
+    if report:
+        print(report, flush=True)
+
+
+def watch_video(
+    read_input: ReadInput,
+    path: str,
+    video_path: str,
+    display_video: str,
+    start_position: float,
+    night_mode=False,
+    sub_file=None,
+    next_video: Optional[Tuple[str, float, Optional[float]]] = None,
+) -> Optional[Tuple[int, str, datetime]]:
+    """
+    Watch a video, next_video is the path, start position and duration of the
+    video likely to be watched next which is prefetched during playback
+    """
+    logger = MpvLogger()
+    player = _create_player(logger, night_mode, sub_file)
+
     session = Session(None, None)
 
     @player.on_key_press("Q")
@@ -127,10 +206,13 @@ def watch_video(
 
     run_before, run_after = _apply_watch_options(player, video_path)
     formatted_duration = None
+    prefetcher: Optional[Prefetcher] = None
+    events = PlayerEvents(player, ("duration", "pause"))
 
     try:
         player.play(video_path)
-        duration = _wait_for_duration_or_terminate(player)
+        events.wait_for(lambda: events.values.get("duration") or events.ended)
+        duration = events.values.get("duration")
         if not duration:
             return None
 
@@ -162,17 +244,19 @@ def watch_video(
             2000,
         )
 
-        register_pause_handler(player)
         read_input.start(lambda key: player.command("keypress", key))
 
-        # wait for video to end
-        try:
-            player.wait_for_playback()
-        except mpv.ShutdownError:
-            pass
+        if next_video:
+            prefetcher = prefetch_video(*next_video)
+
+        # wait for video to end, the pause state seen before now is the initial
+        # state rather than the user pausing
+        events.wait_for(lambda: events.ended, _print_pause)
 
     finally:
         read_input.stop()
+        if prefetcher:
+            prefetcher.cancel()
         if run_after:
             os.system(run_after)
 
@@ -191,5 +275,193 @@ def watch_video(
         + format_duration(session.duration),
         flush=True,
     )
+    _print_startup_report(events)
+    _print_prefetch_report(prefetcher)
 
     return session.position, formatted_duration, end_time
+
+
+# a video that stops this close to its end counts as watched to the end
+FINISHED_TOLERANCE = 1.0
+
+
+@dataclass
+class BingeVideo:
+    video_path: str
+    display_video: str
+    start_position: float
+    duration: Optional[float] = None
+    # anything the caller needs to record having watched the video
+    source: Any = None
+
+
+def binge_videos(
+    read_input: ReadInput,
+    first_video: BingeVideo,
+    get_next_video: Callable[[BingeVideo], Optional[BingeVideo]],
+    on_video_end: Callable[[BingeVideo, float, str, datetime, datetime], None],
+    night_mode=False,
+    sub_file=None,
+) -> None:
+    """
+    Watch videos one after another in a single player until there are no more
+    or the user quits. The next video is found and appended to the playlist
+    while the current one plays so mpv can prefetch it. on_video_end is called
+    with the video, its end position, formatted duration and start and end
+    times as each video ends, after a video that was not watched to the end
+    no more videos are played.
+    """
+    logger = MpvLogger()
+    player = _create_player(logger, night_mode, sub_file)
+    player["prefetch-playlist"] = "yes"
+
+    events = PlayerEvents(player, ("playlist-pos", "duration", "time-pos", "pause"))
+    state: Dict[str, Any] = {
+        "playlist_pos": 0,
+        # end-file is sent once for each playlist entry whether it played or
+        # failed to load, so it counts the entries that have ended
+        "ended": 0,
+        "durations": {},
+        "positions": {},
+        "quit_position": None,
+        "started": False,
+    }
+
+    @player.on_key_press("Q")
+    @player.on_key_press("q")
+    def quit_binding():
+        # set before quitting so it is seen along with the shutdown event
+        state["quit_position"] = player.time_pos
+        player.quit()
+
+    def on_event(name, value):
+        if name == "playlist-pos":
+            state["playlist_pos"] = value
+        elif name == "duration" and value:
+            state["durations"][state["playlist_pos"]] = value
+        elif name == "time-pos" and value is not None:
+            state["positions"][state["playlist_pos"]] = value
+        elif name == "end-file":
+            state["ended"] += 1
+        elif state["started"]:
+            _print_pause(name, value)
+
+    # mpv idles rather than shutting down after a video fails to load, so a
+    # video has also ended once end-file has been sent for it
+    def has_ended(index: int) -> bool:
+        return state["ended"] > index or "shutdown" in events.values
+
+    # each video is played with the watch options of its own directory, so
+    # they are set for each file rather than for the player and the before
+    # and after commands of each video are run as it starts and ends
+    run_before, run_after, player_options = _read_watch_options(first_video.video_path)
+    hooks = {0: (run_before, run_after)}
+    # the after command of the video playing, run even if binging is stopped
+    pending_after: Optional[str] = None
+    video: Optional[BingeVideo] = first_video
+    index = 0
+    prefetcher: Optional[Prefetcher] = None
+
+    try:
+        player.loadfile(first_video.video_path, **_get_file_options(player_options))
+
+        while video:
+            start_time = datetime.now()
+            events.wait_for(
+                lambda: index in state["durations"] or has_ended(index), on_event
+            )
+            duration = state["durations"].get(index, None)
+            if not duration:
+                if "shutdown" not in events.values:
+                    print(f"{video.video_path}: could not be played", file=sys.stderr)
+                break
+
+            print(f"start: {video.video_path}", flush=True)
+            formatted_duration = format_duration(duration)
+            print(
+                f"position: {format_duration(video.start_position)}"
+                f"/{formatted_duration}",
+                flush=True,
+            )
+
+            run_before, pending_after = hooks.pop(index)
+            if index == 0:
+                logger.unsuspend()
+            if run_before:
+                os.system(run_before)
+            if index == 0:
+                # later videos are started at their position by the playlist
+                if video.start_position > 0:
+                    player.seek(video.start_position)
+                state["started"] = True
+                read_input.start(lambda key: player.command("keypress", key))
+
+            player.show_text(
+                video.display_video
+                + " ("
+                + format_duration(video.start_position)
+                + " / "
+                + formatted_duration
+                + ")",
+                2000,
+            )
+
+            next_video = get_next_video(video)
+            if next_video:
+                run_before, run_after, player_options = _read_watch_options(
+                    next_video.video_path
+                )
+                hooks[index + 1] = (run_before, run_after)
+                file_options = _get_file_options(player_options)
+                if next_video.start_position > 0:
+                    file_options["start"] = str(next_video.start_position)
+                player.playlist_append(next_video.video_path, **file_options)
+                prefetcher = prefetch_video(
+                    next_video.video_path,
+                    next_video.start_position,
+                    next_video.duration,
+                )
+
+            events.wait_for(
+                lambda: state["playlist_pos"] != index or has_ended(index), on_event
+            )
+            quit_position = state["quit_position"]
+            last_position = state["positions"].get(index, None)
+            end_time = datetime.now()
+
+            if quit_position is not None:
+                position = quit_position
+            elif last_position is not None and (
+                last_position < duration - FINISHED_TOLERANCE
+            ):
+                # skipped to the next video in the playlist
+                position = last_position
+            else:
+                position = duration
+            finished = position == duration
+
+            print(flush=True)
+            print(f"end: {format_duration(position)}/{formatted_duration}", flush=True)
+            if index == 0:
+                _print_startup_report(events)
+            if prefetcher:
+                # the next video is now playing so stop reading ahead of it
+                prefetcher.cancel()
+                _print_prefetch_report(prefetcher)
+                prefetcher = None
+            on_video_end(video, position, formatted_duration, start_time, end_time)
+            if pending_after:
+                os.system(pending_after)
+                pending_after = None
+
+            if not finished:
+                break
+            video = next_video
+            index += 1
+    finally:
+        read_input.stop()
+        if prefetcher:
+            prefetcher.cancel()
+        player.terminate()
+        if pending_after:
+            os.system(pending_after)
@@ -0,0 +1,89 @@
+from functools import lru_cache
+from typing import Any, Optional
+
+# seconds to wait for a connection and then for each read of the response
+DEFAULT_TIMEOUT = (5.0, 30.0)
+# failed requests are retried after 0.5, 1 and 2 seconds, or when the server
+# asks to be retried after
+RETRIES = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# connections kept open to each host, enough for a search batch
+POOL_SIZE = 16
+
+# how cached responses are used, see webcache
+# use fresh cached responses and store new ones
+CACHE_NORMAL = "normal"
+# ignore cached responses but store new ones
+CACHE_REFRESH = "refresh"
+# only use cached responses, however old, and never make a request
+CACHE_OFFLINE = "offline"
+
+
+@lru_cache(maxsize=None)
+def get_session():
+    """
+    The session shared by every request so connections to each host are
+    kept open and reused
+    """
+    # requests is slow to import so only done when a request is made
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def request(method: str, url: str, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    Make a request with the shared session, returns the response whatever its
+    status and raises ValueError when there is no response
+    """
+    import requests
+
+    try:
+        return get_session().request(method, url, timeout=timeout, **kwargs)
+    except requests.RequestException as err:
+        raise ValueError(f"{method} {url} failed: {err}")
+
+
+def read_json(response) -> Any:
+    """
+    The decoded json of a response, raises ValueError when the request failed
+    """
+    method, url = response.request.method, response.url
+    if not response.ok:
+        raise ValueError(
+            f"{method} {url} failed: {response.status_code} {_get_error(response)}"
+        )
+    try:
+        return response.json()
+    except ValueError:
+        raise ValueError(f"{method} {url} did not return json")
+
+
+def request_json(method: str, url: str, **kwargs) -> Any:
+    return read_json(request(method, url, **kwargs))
+
+
+def _get_error(response) -> Optional[str]:
+    try:
+        error = response.json()["error"]
+    except (ValueError, KeyError, TypeError):
+        return response.reason
+    if isinstance(error, dict):
+        return error.get("message", response.reason)
+    return str(error)
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import time
+import hashlib
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+from xdg import BaseDirectory
+
+from .files import write_atomically
+from .config import DEFAULT_CACHE_TTLS, DEFAULT_CACHE_SIZE, get_user_config
+from .web import CACHE_NORMAL, CACHE_OFFLINE, CACHE_REFRESH, read_json
+
+# parameters that are secrets and do not change the response
+EXCLUDED_PARAMS = frozenset(["key"])
+
+# makes the request for a response that is not cached, given the headers
+# needed to revalidate a stale one
+Fetch = Callable[[Dict[str, str]], Any]
+
+
+def get_cache_options() -> Tuple[Dict[str, float], float]:
+    config = get_user_config()
+    if not config:
+        return DEFAULT_CACHE_TTLS, DEFAULT_CACHE_SIZE
+    return config.get_cache_options()
+
+
+def get_cache_key(url: str, params: Dict[str, Any]) -> str:
+    # the same search written differently shares a response
+    normalized = sorted(
+        (name, re.sub(r"\s+", " ", str(value)).strip())
+        for name, value in params.items()
+        if value is not None and name not in EXCLUDED_PARAMS
+    )
+    return hashlib.sha256(json.dumps([url, normalized]).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Decoded json responses stored one to a file in the user's cache directory.
+    When the files take more than the maximum size the least recently used
+    are removed, the modification time of a file is when it was last used.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, max_size: float = 0):
+        self.__cache_path = cache_path or BaseDirectory.save_cache_path(
+            "babies", "responses"
+        )
+        self.__max_size = int((max_size or get_cache_options()[1]) * 1024 * 1024)
+
+    def __get_path(self, key: str) -> str:
+        return os.path.join(self.__cache_path, key + ".json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        response_path = self.__get_path(key)
+        try:
+            with open(response_path, "r") as stream:
+                cached = json.load(stream)
+            os.utime(response_path)
+        except (OSError, ValueError):
+            return None
+        return cached
+
+    def put(self, key: str, cached: Dict[str, Any]) -> None:
+        response_path = self.__get_path(key)
+        try:
+            with write_atomically(response_path, durable=False) as stream:
+                json.dump(cached, stream)
+            self.__evict()
+        except OSError:
+            # the cache is only an optimisation
+            pass
+
+    def __evict(self) -> None:
+        files = []
+        total_size = 0
+        with os.scandir(self.__cache_path) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total_size <= self.__max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # already evicted by another process
+                pass
+            total_size -= size
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    return ResponseCache()
+
+
+def get_cached_json(
+    source: str,
+    url: str,
+    params: Dict[str, Any],
+    fetch: Fetch,
+    cache_mode: str = CACHE_NORMAL,
+) -> Any:
+    """
+    The decoded json response for a request, from the cache when it was made
+    within the time to live of the source. A stale response is revalidated
+    with its ETag so it is only fetched again when it has changed.
+    """
+    cache = get_response_cache()
+    key = get_cache_key(url, params)
+    cached = None if cache_mode == CACHE_REFRESH else cache.get(key)
+
+    if cache_mode == CACHE_OFFLINE:
+        if not cached:
+            raise ValueError(f"no cached response from {url} for this request")
+        return cached["body"]
+
+    ttl = get_cache_options()[0].get(source, 0)
+    if cached and time.time() - cached["stored"] < ttl:
+        return cached["body"]
+
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    response = fetch(headers)
+
+    if cached and response.status_code == 304:
+        body, etag = cached["body"], cached.get("etag")
+    else:
+        body, etag = read_json(response), response.headers.get("ETag")
+    cache.put(key, {"url": url, "etag": etag, "stored": time.time(), "body": body})
+    return body
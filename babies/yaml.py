@@ -1,3 +1,6 @@
+import io
+import mmap
+from typing import Any, Iterator, List, Optional, Pattern, Tuple, Union
 from ruamel.yaml import YAML, YAMLError
 
 yaml = YAML(typ="safe")
@@ -20,3 +23,121 @@ def save_yaml_file(filepath, data, mode="w"):
             return yaml.dump(data, stream)
         except YAMLError as err:
             raise ValueError(*err.args)
+
+
+def dump_yaml_bytes(data) -> bytes:
+    stream = io.BytesIO()
+    try:
+        yaml.dump(data, stream)
+    except YAMLError as err:
+        raise ValueError(*err.args)
+    return stream.getvalue()
+
+
+# each record appended with save_yaml_file(..., "a") starts a line with this
+LIST_ITEM_PREFIX = b"- "
+_LIST_ITEM_SEPARATOR = b"\n" + LIST_ITEM_PREFIX
+
+
+def load_yaml_chunk(chunk: bytes) -> List[Any]:
+    try:
+        return yaml.load(chunk) or []
+    except YAMLError as err:
+        raise ValueError(*err.args)
+
+
+def iter_yaml_list_buffer_chunks(
+    data: Union[bytes, mmap.mmap],
+    prefilter: Optional[Pattern[bytes]] = None,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield the offset and raw bytes of each top-level item in a yaml list, when a
+    prefilter is given only the items it matches are yielded. The start and end
+    offsets can restrict the items to a range but must lie on item boundaries.
+    """
+    size = len(data) if end is None else min(end, len(data))
+    if start == 0 and data[: len(LIST_ITEM_PREFIX)] != LIST_ITEM_PREFIX:
+        first_item = data.find(_LIST_ITEM_SEPARATOR)
+        if first_item == -1 or data[:first_item].strip():
+            # not a plain block sequence so it cannot be split
+            if size:
+                yield 0, data[:size]
+            return
+
+    position = start
+    while position < size:
+        if prefilter:
+            match = prefilter.search(data, position, size)
+            if not match:
+                return
+            item_start = (
+                data.rfind(_LIST_ITEM_SEPARATOR, position, match.start()) + 1
+            ) or position
+            search_from = match.end()
+        else:
+            item_start = position
+            search_from = position
+
+        item_end = data.find(_LIST_ITEM_SEPARATOR, search_from, size)
+        item_end = size if item_end == -1 else item_end + 1
+        yield item_start, data[item_start:item_end]
+        position = item_end
+
+
+def iter_yaml_list_chunks(
+    filepath: str,
+    prefilter: Optional[Pattern[bytes]] = None,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Like iter_yaml_list_buffer_chunks but reads the yaml list from a file
+    """
+    with open(filepath, "rb") as stream:
+        if not stream.seek(0, 2):
+            return
+
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from iter_yaml_list_buffer_chunks(data, prefilter, start, end)
+
+
+def split_yaml_list_file(filepath: str, parts: int) -> List[Tuple[int, int]]:
+    """
+    Split a yaml list file into up to parts byte ranges of roughly equal size
+    that are aligned on item boundaries
+    """
+    with open(filepath, "rb") as stream:
+        size = stream.seek(0, 2)
+        if not size:
+            return []
+
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[: len(LIST_ITEM_PREFIX)] != LIST_ITEM_PREFIX:
+                return [(0, size)]
+
+            boundaries = [0]
+            for part in range(1, parts):
+                separator = data.find(_LIST_ITEM_SEPARATOR, part * size // parts)
+                if separator == -1:
+                    break
+                if separator + 1 > boundaries[-1]:
+                    boundaries.append(separator + 1)
+            boundaries.append(size)
+
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def iter_yaml_list_file(
+    filepath: str,
+    prefilter: Optional[Pattern[bytes]] = None,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Iterator[Any]:
+    """
+    Yield each item of a yaml list file one at a time, only decoding the items
+    that match the prefilter when it is given
+    """
+    for _, chunk in iter_yaml_list_chunks(filepath, prefilter, start, end):
+        yield from load_yaml_chunk(chunk)
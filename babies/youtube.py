@@ -1,43 +1,185 @@
+import re
 import sys
 import html
-from typing import List
-import requests
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
 
 from .config import Config
 from .yaml import yaml
+from .formatting import format_duration
+from .web import CACHE_NORMAL, request
+from .webcache import get_cached_json
 
+YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3"
+# the most results a page of a search and ids a videos request can have
+MAX_PAGE_SIZE = 50
+DEFAULT_SEARCH_LIMIT = 50
 
-def search_youtube(config: Config, search_terms: List[str], duration: str, raw=False):
-    config.load()
-    api_key = config.get_youtube_api_key()
+# durations like PT1H2M3S
+_ISO_DURATION = re.compile(r"P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?")
+
+
+def _parse_iso_duration(duration: str) -> Optional[float]:
+    match = _ISO_DURATION.fullmatch(duration)
+    if not match:
+        return None
+    days, hours, mins, secs = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + mins) * 60 + secs
+
+
+def _get_youtube_api(
+    config: Config, endpoint: str, params: Dict[str, Any], cache_mode=CACHE_NORMAL
+) -> Any:
+    url = YOUTUBE_API_URL + endpoint
+
+    def fetch(headers):
+        # the key is only needed when a request is made so offline searches
+        # work without one
+        key_params = {**params, "key": config.get_youtube_api_key()}
+        return request("GET", url, params=key_params, headers=headers)
 
-    results = requests.get(
-        "https://www.googleapis.com/youtube/v3/search",
-        {  # type: ignore
+    return get_cached_json("youtube", url, params, fetch, cache_mode)
+
+
+def _get_search_page(
+    config: Config,
+    query: str,
+    duration: Optional[str],
+    page_size: int,
+    page_token: Optional[str],
+    cache_mode=CACHE_NORMAL,
+) -> Any:
+    return _get_youtube_api(
+        config,
+        "/search",
+        {
             "part": "snippet",
             "type": "video",
-            "q": " ".join(search_terms),
-            "maxResults": 50,
-            "key": api_key,
+            "q": query,
+            "maxResults": page_size,
             "videoDuration": duration or "any",
+            "pageToken": page_token,
         },
+        cache_mode,
     )
 
-    def format_search_entry(entry):
-        snippet = entry["snippet"]
-        return {
-            "title": html.unescape(snippet["title"]),
-            "description": html.unescape(snippet["description"]),
-            "channel title": html.unescape(snippet["channelTitle"]),
-            "id": entry["id"]["videoId"],
-        }
-
-    if raw:
-        yaml.dump(results.json(), sys.stdout)
-        return
-
-    yaml.dump(
-        # json.loads(results.text)['items'],
-        list(map(format_search_entry, results.json()["items"])),
-        sys.stdout,
+
+def _get_content_details(
+    config: Config, video_ids: List[str], cache_mode=CACHE_NORMAL
+) -> Dict[str, Any]:
+    # a page has at most as many videos as a single request can look up
+    results = _get_youtube_api(
+        config,
+        "/videos",
+        {
+            "part": "contentDetails",
+            "id": ",".join(video_ids),
+            "maxResults": MAX_PAGE_SIZE,
+        },
+        cache_mode,
     )
+    return {video["id"]: video["contentDetails"] for video in results["items"]}
+
+
+def _format_search_entry(entry, content_details=None):
+    snippet = entry["snippet"]
+    formatted = {
+        "title": html.unescape(snippet["title"]),
+        "description": html.unescape(snippet["description"]),
+        "channel title": html.unescape(snippet["channelTitle"]),
+        "id": entry["id"]["videoId"],
+    }
+    duration = content_details and _parse_iso_duration(content_details["duration"])
+    if duration is not None:
+        formatted["duration"] = format_duration(duration)
+    return formatted
+
+
+def iter_youtube_search(
+    config: Config,
+    search_terms: List[str],
+    duration: Optional[str] = None,
+    limit=DEFAULT_SEARCH_LIMIT,
+    raw=False,
+    exact_durations=False,
+    cache_mode=CACHE_NORMAL,
+) -> Iterator[Any]:
+    """
+    Yield up to limit search results as each page of them arrives. The next
+    page is requested while the current one is handled and, with
+    exact_durations, the durations of the videos on each page are looked up
+    in a single request alongside it.
+    """
+    config.load()
+    query = " ".join(search_terms)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+
+        def request_page(page_token: Optional[str], remaining: int) -> Future:
+            return executor.submit(
+                _get_search_page,
+                config,
+                query,
+                duration,
+                min(remaining, MAX_PAGE_SIZE),
+                page_token,
+                cache_mode,
+            )
+
+        remaining = limit
+        next_page: Optional[Future] = request_page(None, remaining) if limit else None
+        while next_page:
+            page = next_page.result()
+            items = page["items"][:remaining]
+            remaining -= len(items)
+            page_token = page.get("nextPageToken", None)
+            next_page = None
+            if page_token and remaining > 0 and items:
+                next_page = request_page(page_token, remaining)
+
+            all_details: Dict[str, Any] = {}
+            if exact_durations and items:
+                all_details = _get_content_details(
+                    config, [item["id"]["videoId"] for item in items], cache_mode
+                )
+
+            for item in items:
+                content_details = all_details.get(item["id"]["videoId"], None)
+                if not raw:
+                    yield _format_search_entry(item, content_details)
+                elif content_details:
+                    yield {**item, "contentDetails": content_details}
+                else:
+                    yield item
+
+
+def search_youtube(
+    config: Config,
+    search_terms: List[str],
+    duration: Optional[str] = None,
+    raw=False,
+    cache_mode=CACHE_NORMAL,
+    limit=DEFAULT_SEARCH_LIMIT,
+    exact_durations=False,
+    output_format="yaml",
+):
+    """
+    Print search results as they arrive, as a yaml list or as one json
+    object a line
+    """
+    for entry in iter_youtube_search(
+        config,
+        search_terms,
+        duration=duration,
+        limit=limit,
+        raw=raw,
+        exact_durations=exact_durations,
+        cache_mode=cache_mode,
+    ):
+        if output_format == "ndjson":
+            print(json.dumps(entry), flush=True)
+        else:
+            # a list per entry so the output is a single yaml list
+            yaml.dump([entry], sys.stdout)
+            sys.stdout.flush()
@@ -12,11 +12,14 @@ setup(
     packages=["babies"],
     install_requires=[
         "ruamel.yaml>=0.15.77",
-        "python-mpv>=0.3.0",
+        "ruamel.yaml.clib",
+        "python-mpv>=1.0.0",
         "readchar>=2.0.1",
         "ffmpeg",
+        "requests",
+        "urllib3>=1.26",
         "mypy-extensions",
     ],
-    tests_requires=["mypy>=0.711"],
+    tests_requires=["mypy>=0.711", "pytest"],
     zip_safe=False,
 )
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from babies.db import Db, Entry, SessionTime, Viewing
+
+
+def _finished_entry(media, days_ago):
+    entry = Entry(media, alias="../show")
+    entry.duration = 100
+    end_time = datetime.now() - timedelta(days=days_ago)
+    entry.add_viewing(
+        Viewing(SessionTime.at(end_time, 0), SessionTime.at(end_time, 100))
+    )
+    return entry
+
+
+def _load_series(dirpath):
+    db = Db()
+    db.load_series(str(dirpath))
+    return db
+
+
+def test_restored_entries_are_not_archived_again(tmp_path):
+    db = _load_series(tmp_path)
+    db.add_show_to_series(_finished_entry("e01.mkv", 60))
+    db.add_show_to_series(_finished_entry("e02.mkv", 1))
+    db.write_series(str(tmp_path), archive=False)
+    old = datetime.now() - timedelta(days=30)
+    assert db.archive_watched(str(tmp_path), old) == 1
+    db.write_series(str(tmp_path), archive=False)
+
+    db = _load_series(tmp_path)
+    assert db.restore_archived(str(tmp_path)) == 1
+
+    db = _load_series(tmp_path)
+    assert db.archive_watched(str(tmp_path), old) == 0
+    # once the restore itself is old the entry can be archived again
+    assert db.archive_watched(str(tmp_path), datetime.now() + timedelta(days=1)) == 2
@@ -0,0 +1,42 @@
+from babies.db import Db, Entry
+from babies.journal import append_journal, get_journal_path, read_journal
+
+
+def _enqueue(dirpath, media):
+    db = Db()
+    db.load_series(str(dirpath))
+    db.add_show_to_series(Entry(media))
+    db.write_series(str(dirpath))
+
+
+def _load_media(dirpath):
+    db = Db()
+    db.load_series(str(dirpath))
+    return [entry.media for entry in db.get_matching_entries(lambda _: True)]
+
+
+def test_changes_after_a_cut_off_line_are_replayed(tmp_path):
+    _enqueue(tmp_path, "e01.mkv")
+    _enqueue(tmp_path, "e02.mkv")
+    journal_path = get_journal_path(str(tmp_path))
+    with open(journal_path, "a") as stream:
+        # a change that a crash stopped part way through writing
+        stream.write('{"op": "enqueue", "entry": {"vid')
+
+    _enqueue(tmp_path, "e03.mkv")
+    _enqueue(tmp_path, "e04.mkv")
+
+    assert _load_media(tmp_path) == ["e01.mkv", "e02.mkv", "e03.mkv", "e04.mkv"]
+
+
+def test_final_line_missing_only_its_newline_is_kept(tmp_path):
+    journal_path = str(tmp_path / "journal")
+    with open(journal_path, "w") as stream:
+        stream.write('{"op": "dequeue", "media": "e01.mkv"}')
+
+    append_journal(journal_path, [{"op": "dequeue", "media": "e02.mkv"}])
+
+    assert [op["media"] for op in read_journal(journal_path)] == [
+        "e01.mkv",
+        "e02.mkv",
+    ]
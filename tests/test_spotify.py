@@ -0,0 +1,106 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from xdg import BaseDirectory
+
+from babies import config, spotify, webcache
+from babies.config import Config
+from babies.web import CACHE_REFRESH
+
+
+class StubSpotify(BaseHTTPRequestHandler):
+    """
+    Answers token requests and searches like spotify, the first token it hands
+    out is rejected so that the client has to request another
+    """
+
+    tokens_issued = 0
+    searches = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def __reply(self, status, body):
+        encoded = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            StubSpotify.tokens_issued += 1
+            token = f"token-{StubSpotify.tokens_issued}"
+        self.__reply(200, {"access_token": token, "expires_in": 3600})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if self.headers["Authorization"] == "Bearer token-1":
+            self.__reply(401, {"error": {"message": "The access token expired"}})
+            return
+        with self.lock:
+            StubSpotify.searches += 1
+        query = parse_qs(url.query)["q"][0]
+        track = {
+            "artists": [{"name": "artist"}],
+            "album": {"name": "album", "uri": "spotify:album:1"},
+            "name": query,
+            "track_number": 1,
+            "uri": f"spotify:track:{query}",
+        }
+        self.__reply(
+            200,
+            {
+                "albums": {"items": []},
+                "tracks": {"items": [track]},
+                "episodes": {"items": []},
+            },
+        )
+
+
+@pytest.fixture
+def stub_spotify(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSpotify)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(spotify, "SPOTIFY_TOKEN_URL", url + "/api/token")
+    monkeypatch.setattr(spotify, "SPOTIFY_API_URL", url + "/v1")
+    # the token and the responses are stored away from the user's files
+    monkeypatch.setattr(BaseDirectory, "xdg_data_home", str(tmp_path / "data"))
+    monkeypatch.setattr(BaseDirectory, "xdg_data_dirs", [str(tmp_path / "data")])
+    monkeypatch.setattr(BaseDirectory, "xdg_cache_home", str(tmp_path / "cache"))
+    monkeypatch.setattr(BaseDirectory, "xdg_config_home", str(tmp_path / "config"))
+    monkeypatch.setattr(BaseDirectory, "xdg_config_dirs", [str(tmp_path / "config")])
+    config.get_user_config.cache_clear()
+    webcache.get_response_cache.cache_clear()
+    StubSpotify.tokens_issued = 0
+    StubSpotify.searches = 0
+    yield
+    server.shutdown()
+    server.server_close()
+    config.get_user_config.cache_clear()
+    webcache.get_response_cache.cache_clear()
+
+
+def test_batch_shares_one_replaced_token(stub_spotify, capsys):
+    spotify_config = Config()
+    spotify_config.config = {"spotify": {"client-id": "id", "client-secret": "secret"}}
+    queries = [f"query {index}" for index in range(12)]
+
+    spotify.search_spotify_batch(
+        spotify_config, queries, jobs=4, cache_mode=CACHE_REFRESH
+    )
+
+    # the rejected token is replaced once and the new one used by every search
+    assert StubSpotify.tokens_issued == 2
+    assert StubSpotify.searches == len(queries)
+    results = spotify.yaml.load(capsys.readouterr().out)
+    assert [result["query"] for result in results] == queries
+    assert [result["results"][0]["name"] for result in results] == queries
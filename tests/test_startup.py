@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import subprocess
+
+from babies.startup import HEAVY_MODULES
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs babies then prints the heavy modules that were imported as json
+PRINT_HEAVY_MODULES = """
+import sys, json
+from babies.command import run_babies
+from babies.startup import HEAVY_MODULES
+
+sys.argv = ["babies"] + sys.argv[1:]
+run_babies()
+print(json.dumps([module for module in HEAVY_MODULES if module in sys.modules]))
+"""
+
+
+def _run_babies(tmp_path, *args):
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT_PATH,
+        "HOME": str(tmp_path),
+        "XDG_CACHE_HOME": str(tmp_path / "cache"),
+        "XDG_CONFIG_HOME": str(tmp_path / "config"),
+        "XDG_DATA_HOME": str(tmp_path / "data"),
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", PRINT_HEAVY_MODULES, *args],
+        env=env,
+        cwd=str(tmp_path),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return result.stdout.splitlines()
+
+
+def test_print_imports_no_heavy_modules(tmp_path):
+    series_path = tmp_path / "series"
+    series_path.mkdir()
+    (series_path / "episode 1.mkv").touch()
+
+    *output, heavy_modules = _run_babies(tmp_path, "print", str(series_path))
+
+    assert "episode 1.mkv" in output[-1]
+    assert json.loads(heavy_modules) == []
+    assert "mpv" in HEAVY_MODULES and "dbus" in HEAVY_MODULES